@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from iso8601 import parse_date
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def split_windows(date_from, date_to, days=7):
+    """split [date_from, date_to) into list of (from, to) date strings"""
+    days = max(int(days), 1)
+    start = parse_date(date_from[:10])
+    end = parse_date(date_to[:10])
+    windows = list()
+    while start < end:
+        stop = min(start + timedelta(days=days), end)
+        windows.append((start.strftime("%Y-%m-%d"), stop.strftime("%Y-%m-%d")))
+        start = stop
+    return windows
+
+
+def window_name(window):
+    return 'backfill:%s:%s' % window
+
+
+def run_window(app, window):
+    """process dateModified feed from window start until its end,
+    each window has own checkpoint so it resumes after crash"""
+    date_from, date_to = window
+    app.worker_name = window_name(window)
+    app.feed_offset = None
+    app.held_page = None
+    app.client.params.pop('offset', None)
+    app.skip_until = date_from
+    app.feed_until = date_to
+    if not app.restore_checkpoint():
+        logger.info("Start window %s from %s", app.worker_name, date_from)
+        app.client.params['offset'] = date_from
+    app.process_all(sleep_time=0)
+    # don't mark window finished with failed tenders
+    while app.failed_tenders and not app.should_stop:
+        app.sleep(1)
+        app.retry_failed(sleep_time=0)
+    if app.should_stop:
+        return False
+    # mark window finished, resume will stop at first page
+    app.save_checkpoint(date_to, date_to)
+    metrics.inc('backfill_windows_total')
+    logger.info("Finished window %s", app.worker_name)
+    return True
+
+
+def run_windows(app, windows):
+    for window in windows:
+        if not run_window(app, window):
+            raise SystemExit("Stop backfill at window %s" % window_name(window))
+    logger.info("Backfill finished %d windows", len(windows))
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""End-to-end throughput benchmark with fake OpenProcurement API
+
+Usage: complaints-bench [--tenders 10000] [--backend sqlite] [--config config.ini]
+"""
+import os
+import sys
+import random
+import resource
+import argparse
+import tempfile
+import threading
+import logging
+import logging.config
+from time import time
+from datetime import datetime, timedelta
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from ConfigParser import ConfigParser
+from simplejson import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def random_id(rnd):
+    return '%032x' % rnd.getrandbits(128)
+
+
+def generate_complaint(rnd, date, doc_size, related_lot=None):
+    complaint = {
+        'id': random_id(rnd),
+        'title': 'Complaint title',
+        'description': 'x' * doc_size,
+        'status': rnd.choice(['pending', 'accepted', 'satisfied', 'resolved', 'invalid']),
+        'type': 'complaint',
+        'dateSubmitted': date,
+        'documents': [{'id': random_id(rnd), 'title': 'document.pdf',
+                       'url': 'http://localhost/document'}],
+    }
+    if related_lot:
+        complaint['relatedLot'] = related_lot
+    return complaint
+
+
+def generate_tender(rnd, index, date, complaints=1.0, awards=1, qualifications=0,
+                    lots=1, doc_size=1000):
+    """return synthetic tender, complaints is mean number of complaints per
+    tender and per each award or qualification"""
+    def count():
+        return int(complaints) + (1 if rnd.random() < complaints - int(complaints) else 0)
+    lots_list = [{'id': random_id(rnd), 'status': rnd.choice(['active', 'cancelled'])}
+        for _ in range(lots)]
+    lot_id = lambda: rnd.choice(lots_list)['id'] if lots_list else None
+    tender = {
+        'id': random_id(rnd),
+        'tenderID': 'UA-%s-%06d' % (date[:10], index),
+        'title': 'Tender %d' % index,
+        'status': rnd.choice(['active.tendering', 'active.qualification', 'complete',
+            'cancelled', 'unsuccessful']),
+        'mode': '',
+        'procuringEntity': {'name': 'Procuring entity', 'identifier': {'id': '00000000'}},
+        'procurementMethod': 'open',
+        'procurementMethodType': 'aboveThresholdUA',
+        'dateModified': date,
+        'lots': lots_list,
+        'documents': [{'id': random_id(rnd), 'title': 'document.pdf',
+                       'description': 'd' * doc_size} for _ in range(3)],
+        'bids': [{'id': random_id(rnd), 'value': {'amount': 1000}} for _ in range(3)],
+        'complaints': [generate_complaint(rnd, date, doc_size, lot_id()) for _ in range(count())],
+    }
+    if awards:
+        tender['awards'] = [{'id': random_id(rnd), 'status': 'active',
+            'complaints': [generate_complaint(rnd, date, doc_size) for _ in range(count())]}
+            for _ in range(awards)]
+    if qualifications:
+        tender['qualifications'] = [{'id': random_id(rnd), 'status': 'active',
+            'complaints': [generate_complaint(rnd, date, doc_size) for _ in range(count())]}
+            for _ in range(qualifications)]
+    return tender
+
+
+class FakeAPI(object):
+    """in-memory tenders storage with changes and dateModified feeds"""
+
+    def __init__(self, tenders=1000, seed=1, start_date='2016-09-01', **kwargs):
+        rnd = random.Random(seed)
+        date = datetime.strptime(start_date, '%Y-%m-%d')
+        self.tenders = dict()
+        self.feed = list()
+        for i in range(tenders):
+            date += timedelta(seconds=rnd.randint(1, 60))
+            tender = generate_tender(rnd, i, date.isoformat() + '+03:00', **kwargs)
+            self.tenders[tender['id']] = dumps({'data': tender})
+            self.feed.append((tender['id'], tender['dateModified']))
+
+    def get_page(self, feed='changes', offset=None, limit=100, descending=False):
+        """return (items, next_offset), changes feed offset is position in feed"""
+        if feed == 'dateModified':
+            if descending:
+                items = [i for i in reversed(self.feed) if not offset or i[1] < offset]
+            else:
+                items = [i for i in self.feed if not offset or i[1] > offset]
+            items = items[:limit]
+            next_offset = items[-1][1] if items else offset
+            return items, next_offset
+        if offset in (None, ''):
+            offset = len(self.feed) if descending else 0
+        offset = int(offset)
+        if descending:
+            start = max(offset - limit, 0)
+            items = list(reversed(self.feed[start:offset]))
+            return items, start
+        items = self.feed[offset:offset+limit]
+        return items, offset + len(items)
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send_json(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'SERVER_ID=fake; Path=/')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_json(200, '')
+
+    def do_GET(self):
+        api = self.server.api
+        url = urlparse(self.path)
+        path = url.path.rstrip('/').split('/')
+        if len(path) < 4 or path[1] != 'api':
+            return self.send_json(404, dumps({'status': 'error'}))
+        if path[3] == 'spore':
+            return self.send_json(200, dumps({'spore': 1}))
+        if len(path) == 5:
+            tender = api.tenders.get(path[4])
+            if not tender:
+                return self.send_json(404, dumps({'status': 'error'}))
+            return self.send_json(200, tender)
+        query = dict([(k, v[0]) for k, v in parse_qs(url.query).items()])
+        feed = query.get('feed', 'changes')
+        items, offset = api.get_page(feed, query.get('offset'),
+            int(query.get('limit', 100)), bool(query.get('descending')))
+        query['offset'] = offset
+        next_path = '/'.join(path) + '?' + '&'.join(['%s=%s' % kv for kv in query.items()])
+        return self.send_json(200, dumps({
+            'data': [{'id': i, 'dateModified': d} for i, d in items],
+            'next_page': {'offset': offset, 'path': next_path,
+                          'uri': 'http://%s:%d%s' % (self.server.server_address + (next_path,))},
+        }))
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, api, address=('127.0.0.1', 0)):
+        HTTPServer.__init__(self, address, FakeAPIHandler)
+        self.api = api
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class StageTimer(object):
+    """wrap callable and record call latencies"""
+
+    def __init__(self, func):
+        self.func = func
+        self.times = list()
+
+    def __call__(self, *args, **kwargs):
+        start = time()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.times.append(time() - start)
+
+    def percentile(self, p):
+        if not self.times:
+            return 0
+        times = sorted(self.times)
+        return times[min(int(len(times) * p / 100.0), len(times) - 1)]
+
+
+app_stages = ['get_tender_data', 'check_cache_list', 'get_exists_list', 'store',
+    'finish_tender', 'flush', 'ping_backend']
+
+
+def instrument(app):
+    stages = dict()
+    for name in app_stages:
+        stages[name] = StageTimer(getattr(app, name))
+        setattr(app, name, stages[name])
+    stages['get_tenders'] = StageTimer(app.client.get_tenders)
+    app.client.get_tenders = stages['get_tenders']
+    return stages
+
+
+def create_app(args, client_config):
+    if args.backend == 'mysql':
+        from openprocurement.complaints.queue.mysql import ComplaintsToMySQL
+        config = ConfigParser()
+        config.read(args.config)
+        return ComplaintsToMySQL(client_config, config.items('mysql'))
+    from openprocurement.complaints.queue.sqlite import ComplaintsToSQLite
+    return ComplaintsToSQLite(client_config, [('database', args.database), ('drop_cache', 1)])
+
+
+def run_benchmark(args):
+    logger.info("Generate %d tenders", args.tenders)
+    api = FakeAPI(args.tenders, seed=args.seed, complaints=args.complaints,
+        awards=args.awards, qualifications=args.qualifications, lots=args.lots,
+        doc_size=args.doc_size)
+    server = FakeAPIServer(api)
+    server.start()
+    logger.info("Fake API listen on %s", server.url)
+
+    client_config = [
+        ('host_url', server.url),
+        ('api_version', '2.3'),
+        ('limit', args.limit),
+        ('use_cache', args.use_cache),
+        ('skip_until', '2000-01-01'),
+        ('fetch_workers', args.fetch_workers),
+        ('prefetch_pages', args.prefetch_pages),
+        ('transport', args.transport),
+        ('worker_name', 'benchmark'),
+    ]
+    app = create_app(args, client_config)
+    stages = instrument(app)
+    start_time = time()
+    app.process_all(sleep_time=0)
+    elapsed = time() - start_time
+    server.shutdown()
+
+    complaints = len(stages['store'].times)
+    report = ["Tenders %d complaints %d in %1.2f sec" % (app.tenders_count, complaints, elapsed),
+        "Tenders/s %1.1f complaints/s %1.1f" % (app.tenders_count / elapsed, complaints / elapsed)]
+    for name in ['get_tenders'] + app_stages:
+        timer = stages[name]
+        report.append("%-16s calls %6d p50 %8.2f ms p99 %8.2f ms" % (name, len(timer.times),
+            1000 * timer.percentile(50), 1000 * timer.percentile(99)))
+    report.append("Peak RSS %d KB" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Complaints queue throughput benchmark')
+    parser.add_argument('--tenders', type=int, default=10000, help='number of tenders in feed')
+    parser.add_argument('--complaints', type=float, default=1.0,
+        help='mean complaints per tender, award and qualification')
+    parser.add_argument('--awards', type=int, default=1, help='awards per tender')
+    parser.add_argument('--qualifications', type=int, default=0, help='qualifications per tender')
+    parser.add_argument('--lots', type=int, default=1, help='lots per tender')
+    parser.add_argument('--doc-size', type=int, default=1000, help='size of text fields')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--limit', type=int, default=1000, help='feed page size')
+    parser.add_argument('--fetch-workers', type=int, default=1, help='tenders fetch threads')
+    parser.add_argument('--prefetch-pages', type=int, default=0, help='pipelined mode queue size')
+    parser.add_argument('--transport', default='restkit', help='client transport')
+    parser.add_argument('--use-cache', default='yes', help='use tenders cache')
+    parser.add_argument('--backend', default='sqlite', choices=['sqlite', 'mysql'])
+    parser.add_argument('--database', help='sqlite database file, temporary by default')
+    parser.add_argument('--config', help='config.ini with [mysql] section for mysql backend')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show worker log')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(message)s')
+    logger.setLevel(logging.INFO)
+    if args.backend == 'mysql' and not args.config:
+        sys.exit("mysql backend needs --config")
+    tmpdir = None
+    if args.backend == 'sqlite' and not args.database:
+        tmpdir = tempfile.mkdtemp(prefix='complaints-bench')
+        args.database = os.path.join(tmpdir, 'complaints.db')
+    try:
+        for line in run_benchmark(args):
+            print(line)
+    finally:
+        if tmpdir:
+            for name in os.listdir(tmpdir):
+                os.remove(os.path.join(tmpdir, name))
+            os.rmdir(tmpdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
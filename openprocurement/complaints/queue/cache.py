@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import zlib
+from time import time
+from array import array
+from bisect import bisect_left
+from hashlib import md5
+from collections import OrderedDict
+from threading import Lock
+
+
+class TenderCache(object):
+    """In-memory LRU cache of tender_id -> dateModified,
+    entries with expires timestamp in the past are misses"""
+
+    def __init__(self, size=100000):
+        self.size = int(size or 0)
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, tender_id):
+        return tender_id in self.items
+
+    def get(self, tender_id):
+        with self.lock:
+            value = self.items.pop(tender_id, None)
+            if value is None or (value[1] and value[1] < time()):
+                self.misses += 1
+                return None
+            # move to the end as recently used
+            self.items[tender_id] = value
+            self.hits += 1
+            return value[0]
+
+    def set(self, tender_id, date_modified, expires=None):
+        if not self.size:
+            return
+        with self.lock:
+            self.items.pop(tender_id, None)
+            self.items[tender_id] = (date_modified, expires)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def update(self, items):
+        """items are (tender_id, dateModified) or (tender_id, dateModified, expires)"""
+        for item in items:
+            self.set(*item)
+
+    def discard(self, tender_id):
+        with self.lock:
+            self.items.pop(tender_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class FinalTenders(object):
+    """Compact set of tenders which won't get new complaints, keeps 64 bit
+    key of tender_id and 32 bit hash of dateModified in sorted arrays,
+    about 12 bytes per tender, recent changes are merged in batches"""
+
+    # typecode of values array
+    value_type = 'I'
+
+    def __init__(self, merge_size=10000):
+        self.keys = array('L')
+        self.values = array(self.value_type)
+        self.pending = dict()
+        self.merge_size = merge_size
+        self.lock = Lock()
+        self.removed = 0
+
+    @staticmethod
+    def key(tender_id):
+        try:
+            return int(tender_id[:16], 16)
+        except ValueError:
+            return int(md5(tender_id).hexdigest()[:16], 16)
+
+    @staticmethod
+    def value(date_modified):
+        # 0 marks removed entry
+        return (zlib.crc32(date_modified) & 0xffffffff) or 1
+
+    def __len__(self):
+        # approximate, pending entries could replace merged ones
+        return len(self.keys) - self.removed + len(self.pending)
+
+    def lookup(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.values[i]
+        return None
+
+    def __contains__(self, tender_id):
+        with self.lock:
+            return bool(self.lookup(self.key(tender_id)))
+
+    def check(self, tender_id, date_modified):
+        """return True if tender is final and not changed since"""
+        with self.lock:
+            return self.lookup(self.key(tender_id)) == self.value(date_modified)
+
+    def add(self, tender_id, date_modified):
+        with self.lock:
+            self.pending[self.key(tender_id)] = self.value(date_modified)
+            if len(self.pending) >= max(self.merge_size, len(self.keys) // 8):
+                self.merge()
+
+    def discard(self, tender_id):
+        key = self.key(tender_id)
+        with self.lock:
+            if key in self.pending:
+                # removed from arrays on merge
+                self.pending[key] = 0
+                return
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key and self.values[i]:
+                self.values[i] = 0
+                self.removed += 1
+
+    def merge(self):
+        keys, values = array('L'), array(self.value_type)
+        start = 0
+        for key, value in sorted(self.pending.items()):
+            i = bisect_left(self.keys, key, start)
+            keys.extend(self.keys[start:i])
+            values.extend(self.values[start:i])
+            # pending value replaces merged one
+            if i < len(self.keys) and self.keys[i] == key:
+                i += 1
+            if value:
+                keys.append(key)
+                values.append(value)
+            start = i
+        keys.extend(self.keys[start:])
+        values.extend(self.values[start:])
+        if self.removed:
+            index = [i for i, v in enumerate(values) if v]
+            keys = array('L', [keys[i] for i in index])
+            values = array(self.value_type, [values[i] for i in index])
+        self.keys, self.values = keys, values
+        self.pending = dict()
+        self.removed = 0
+
+    def clear(self):
+        with self.lock:
+            self.keys = array('L')
+            self.values = array(self.value_type)
+            self.pending = dict()
+            self.removed = 0
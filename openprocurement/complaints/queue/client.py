@@ -1,12 +1,24 @@
 # -*- coding: utf-8 -*-
-from time import sleep, time
+from time import time
 from munch import munchify
 from iso8601 import parse_date
 from datetime import datetime, timedelta
 from simplejson import dumps, loads
+from Queue import Empty
+from collections import deque, OrderedDict
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
 from restkit.errors import ResourceNotFound
 from openprocurement_client.client import TendersClient
 from openprocurement_client.exceptions import InvalidResponse
+from openprocurement.complaints.queue.cache import TenderCache, FinalTenders
+from openprocurement.complaints.queue.extract import extract_tender
+from openprocurement.complaints.queue.feed import parse_feed_page
+from openprocurement.complaints.queue.governor import Governor
+from openprocurement.complaints.queue.metrics import metrics
+from openprocurement.complaints.queue.profiler import profiler
+from openprocurement.complaints.queue.pipeline import FeedReader
+from openprocurement.complaints.queue.scheduler import PollScheduler, Wakeup
 from openprocurement.complaints.queue.utils import getboolean, retry
 
 import socket
@@ -14,20 +26,40 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def numeric_offset(offset):
+    """return feed offset as int, None if it is opaque"""
+    try:
+        return int(offset)
+    except (TypeError, ValueError):
+        return None
+
+
 class SafeTendersClient(TendersClient):
     def __init__(self, *args, **kwargs):
         self.user_agent = kwargs.pop('user_agent', None)
         self.timeout = kwargs.pop('timeout', 300)
+        self.governor = kwargs.pop('governor', None)
         if self.timeout: socket.setdefaulttimeout(self.timeout)
         super(SafeTendersClient, self).__init__(*args, **kwargs)
 
     def request(self, *args, **kwargs):
         if 'User-Agent' not in self.headers and self.user_agent:
             self.headers['User-Agent'] = self.user_agent
+        if self.governor:
+            with self.governor.request():
+                return super(TendersClient, self).request(*args, **kwargs)
         return super(TendersClient, self).request(*args, **kwargs)
 
-    # get_tenders with improved @retry decorator
-    @retry(tries=3, delay=10, logger=logger)
+    def get_tender(self, tender_id):
+        """return decoded tender json w/o munchify"""
+        response = self.get('{}/{}'.format(self.prefix_path, tender_id))
+        if response.status_int == 200:
+            return loads(response.body_string())
+        raise InvalidResponse
+
+    # get_tenders with improved @retry decorator,
+    # governor paces requests after failures, don't wait long here
+    @retry(tries=3, delay=2, logger=logger)
     def get_tenders(self, params={}, feed='changes'):
         params['feed'] = feed
         try:
@@ -36,9 +68,9 @@ class SafeTendersClient(TendersClient):
                 self.prefix_path,
                 params_dict=self.params)
             if response.status_int == 200:
-                tender_list = munchify(loads(response.body_string()))
-                self._update_params(tender_list.next_page)
-                return tender_list.data
+                data, next_page = parse_feed_page(response.body_string())
+                self._update_params(next_page)
+                return data
         except ResourceNotFound:
             self.params.pop('offset', None)
             raise
@@ -57,14 +89,35 @@ class ComplaintsClient(object):
         'limit': 1000,
         'timeout': 30,
         'use_cache': False,
+        'cache_size': 100000,
+        'cache_preload': False,
+        'final_cache': True,
         'store_claim': False,
         'store_draft': False,
         'fast_rewind': False,
         'skip_until': None,
         'reset_hour': 22,
         'clear_cache': 6,
+        'cache_ttl': 7,
+        'cache_ttl_final': 90,
+        'cache_expire_batch': 1000,
+        'cache_expire_interval': 60,
+        'retry_failed_interval': 60,
+        'retry_failed_max': 5,
         'user_agent': '',
         'sleep': 10,
+        'sleep_min': 1,
+        'sleep_max': 300,
+        'fetch_workers': 1,
+        'worker_name': '',
+        'transport': 'restkit',
+        'prefetch_pages': 0,
+        'rate_max': 0,
+        'rate_min': 0.5,
+        'slow_request': 10,
+        'circuit_errors': 5,
+        'circuit_timeout': 10,
+        'circuit_max': 300,
     }
 
     reset_client_hour = 22
@@ -74,24 +127,72 @@ class ComplaintsClient(object):
     tenders_count = 0
     skipped_count = 0
 
+    # tenders in these statuses don't change, cache them longer
+    final_statuses = ('complete', 'cancelled', 'unsuccessful')
+    final_complaint_statuses = ('resolved', 'invalid', 'declined', 'cancelled',
+        'ignored', 'stopped', 'mistaken')
+
     store_tender_fields = ['id', 'tenderID', 'title', 'status', 'mode',
         'procuringEntity', 'procurementMethod', 'procurementMethodType',
         'dateModified']
 
     watchdog = None
+    leases = None
+    fetch_pool = None
+    feed_offset = None
+    # dateModified where process_all stops, set by backfill windows
+    feed_until = None
+    rewind_requests = 0
+    feed_items = 0
+    feed_full_pages = 0
+    last_expire_time = 0
+    last_retry_time = 0
+    held_page = None
 
     def __init__(self, client_config=None):
         if client_config:
             self.client_config.update(client_config)
         self.conf_timeout = float(self.client_config['timeout'] or 30)
         self.conf_sleep = float(self.client_config['sleep'] or 10)
-        for k in ['use_cache', 'store_claim', 'store_draft', 'fast_rewind']:
+        self.fetch_workers = int(self.client_config['fetch_workers'] or 1)
+        self.prefetch_pages = int(self.client_config['prefetch_pages'] or 0)
+        for k in ['use_cache', 'cache_preload', 'final_cache', 'store_claim', 'store_draft',
+                  'fast_rewind']:
             self.client_config[k] = getboolean(self.client_config.get(k))
         self.descending_mode = getboolean(self.client_config.get('descending'))
         self.reset_client_hour = int(self.client_config['reset_hour'])
         self.clear_cache_wday = int(self.client_config['clear_cache'])
+        # cache ttl in days, 0 means weekly clear_cache as before
+        self.cache_ttl = 86400 * float(self.client_config['cache_ttl'] or 0)
+        self.cache_ttl_final = 86400 * float(self.client_config['cache_ttl_final'] or 0) \
+            or self.cache_ttl
+        self.cache_expire_batch = int(self.client_config['cache_expire_batch'] or 1000)
+        self.cache_expire_interval = float(self.client_config['cache_expire_interval'] or 60)
+        self.last_expire_time = time()
+        self.retry_failed_interval = float(self.client_config['retry_failed_interval'] or 60)
+        self.retry_failed_max = int(self.client_config['retry_failed_max'] or 5)
+        # tender_id -> (FeedItem, attempts), checkpoint is held until retried
+        self.failed_tenders = OrderedDict()
+        # failed tenders with dropped writes, not cleared by page results
+        self.dropped_ids = set()
         self.skip_until = self.client_config['skip_until']
-        self.reset_client()
+        self.worker_name = self.client_config['worker_name'] or \
+            ('backward' if self.descending_mode else 'forward')
+        self.tender_cache = TenderCache(self.client_config['cache_size'])
+        self.final_tenders = FinalTenders()
+        self.scheduler = PollScheduler(self.conf_sleep,
+            self.client_config['sleep_min'] or 1, self.client_config['sleep_max'] or 300)
+        self.wakeup_event = Wakeup()
+        self.governor = Governor(self.fetch_workers + 1,
+            rate_max=self.client_config['rate_max'],
+            rate_min=self.client_config['rate_min'],
+            slow_request=self.client_config['slow_request'],
+            circuit_errors=self.client_config['circuit_errors'],
+            circuit_timeout=self.client_config['circuit_timeout'],
+            circuit_max=self.client_config['circuit_max'],
+            stopped=lambda: self.should_stop, idle=self.reset_watchdog)
+        # feed offset is set by open_feed once backend can restore checkpoint
+        self.reset_client(restore_offset=False)
 
     @property
     def should_stop(self):
@@ -102,24 +203,136 @@ class ComplaintsClient(object):
     def reset_watchdog(self):
         if self.watchdog:
             self.watchdog.counter = 0
+        profiler.poll()
 
     def sleep(self, seconds):
-        for i in range(int(10 * seconds)):
-            if self.should_stop:
-                break
+        deadline = time() + seconds
+        while not self.should_stop:
             self.reset_watchdog()
-            sleep(0.1)
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            # wait in 1 sec steps to keep watchdog and profiler alive
+            if self.wakeup_event.wait(min(remaining, 1.0)):
+                break
+
+    def wakeup(self):
+        """interrupt current sleep, safe to call from threads and signal handlers"""
+        self.wakeup_event.set()
+
+    def count_page(self, tenders_list):
+        self.feed_items += len(tenders_list)
+        if len(tenders_list) >= int(self.client_config['limit'] or 100):
+            self.feed_full_pages += 1
 
     def clear_cache(self):
         logger.debug("Fake clear cache")
 
+    def cache_expires(self, status=None, updated=None):
+        """return expire timestamp of cache entry updated at given time"""
+        if not self.cache_ttl:
+            return None
+        ttl = self.cache_ttl_final if status in self.final_statuses else self.cache_ttl
+        return (float(updated) if updated else time()) + ttl
+
+    def get_cache_list(self, tenders_list):
+        """return dict tender_id -> (cached dateModified, expires)"""
+        return dict()
+
+    def expire_cache_list(self, limit):
+        """delete up to limit expired cache entries, return their tender ids"""
+        return list()
+
+    def expire_cache(self):
+        """evict expired cache entries in small batches spread over time"""
+        if not self.client_config['use_cache'] or not self.cache_ttl:
+            return
+        if time() - self.last_expire_time < self.cache_expire_interval:
+            return
+        self.last_expire_time = time()
+        try:
+            with metrics.timer('stage_seconds', stage='expire_cache'):
+                expired = self.expire_cache_list(self.cache_expire_batch)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            logger.error("Fail expire cache {}: {}".format(type(e), e))
+            self.handle_error(e)
+            return
+        for tender_id in expired:
+            self.tender_cache.discard(tender_id)
+        if expired:
+            metrics.inc('cache_expired_total', len(expired))
+            logger.info("Expired %d cache entries", len(expired))
+
+    def check_cache_list(self, tenders_list):
+        """return set of tender ids not changed since last processing"""
+        cached = dict()
+        missed = list()
+        for tender in tenders_list:
+            date_modified = self.tender_cache.get(tender.id)
+            if date_modified:
+                cached[tender.id] = date_modified
+            else:
+                missed.append(tender)
+        if missed:
+            now = time()
+            for tender_id, (date_modified, expires) in self.get_cache_list(missed).items():
+                # row could be not yet deleted by expire_cache
+                if expires and expires < now:
+                    continue
+                self.tender_cache.set(tender_id, date_modified, expires)
+                cached[tender_id] = date_modified
+        return set([t.id for t in tenders_list if cached.get(t.id) == t.dateModified])
+
+    def use_final_cache(self):
+        return self.client_config['use_cache'] and self.client_config['final_cache']
+
+    def is_final(self, tender, complaints):
+        """True if tender and all its complaints are in final statuses"""
+        if tender.get('status') not in self.final_statuses:
+            return False
+        for _, comp in complaints:
+            if comp.get('status') not in self.final_complaint_statuses:
+                return False
+        return True
+
+    def store_final(self, tender_id, date_modified):
+        """persist final tender, date_modified None means delete"""
+        pass
+
+    def store_processed(self, tender_id, date_modified):
+        """persist last processed dateModified of tender, kept w/o expiration"""
+        pass
+
+    def finish_final(self, tender, complaints):
+        if self.is_final(tender, complaints):
+            self.final_tenders.add(tender.id, tender.dateModified)
+            self.store_final(tender.id, tender.dateModified)
+        elif tender.id in self.final_tenders:
+            self.final_tenders.discard(tender.id)
+            self.store_final(tender.id, None)
+
     def check_cache(self, tender):
-        return False
+        return tender.id in self.check_cache_list([tender])
+
+    def get_exists_list(self, tender, complaints):
+        """return dict complaint_id -> (tender_status, tender_dateModified, complaint_hash)"""
+        return dict()
 
-    def check_exists(self, tender, complaint_path, complaint):
+    def check_exists(self, tender, complaint_path, complaint, row=None):
+        # don't update rows in terminal status
+        if row and row[0] == "cancelled":
+            logger.info("Ignore T=%s P=%s C=%s by TS=cancelled",
+                tender.id, complaint_path, complaint.id)
+            return True
+        if row and row[1] == tender.dateModified:
+            logger.info("Exists T=%s P=%s C=%s by DM=%s",
+                tender.id, complaint_path, complaint.id, tender.dateModified)
+            return True
         return False
 
-    def store(self, complaint, complaint_path):
+    def store(self, complaint, complaint_path, complaint_hash=None):
         logger.debug("Fake Store T=%s P=%s C=%s", complaint.tender.id,
             complaint_path, complaint.id)
 
@@ -129,16 +342,36 @@ class ComplaintsClient(object):
 
     def finish_tender(self, tender):
         logger.debug("Finish tender T=%s DM=%s", tender.id, tender.dateModified)
+        self.tender_cache.set(tender.id, tender.dateModified,
+            self.cache_expires(tender.get('status')))
+
+    def flush(self, force=False):
+        pass
 
     def ping_backend(self):
         pass
 
+    def restore_checkpoint(self):
+        return False
+
+    def clear_checkpoint(self):
+        logger.debug("Clear checkpoint W=%s", self.worker_name)
+
+    def restore_skip_until(self):
+        pass
+
+    def iter_processed(self):
+        """yield (tender_id, dateModified) of stored and processed tenders"""
+        return iter(())
+
+    def save_checkpoint(self, feed_offset, date_modified):
+        logger.debug("Checkpoint W=%s O=%s DM=%s", self.worker_name,
+            feed_offset, date_modified)
+
     def related_lot_status(self, tender, complaint):
         relatedLot = complaint.get('relatedLot', None)
         if relatedLot:
-            for lot in tender.lots:
-                if lot.id == relatedLot:
-                    return lot.status
+            return tender.lot_status(relatedLot)
         return None
 
     def patch_before_store(self, tender, complaint, complaint_path):
@@ -179,60 +412,328 @@ class ComplaintsClient(object):
 
         return False
 
-    def process_complaint(self, tender, complaint_path, complaint):
+    def complaint_hash(self, complaint):
+        """return sha1 of complaint content except tender.dateModified"""
+        tender_info = complaint.tender
+        complaint.tender = dict([(k, v) for k, v in tender_info.items() if k != 'dateModified'])
+        try:
+            return sha1(dumps(complaint, sort_keys=True)).hexdigest()
+        finally:
+            complaint.tender = tender_info
+
+    def process_complaint(self, tender, complaint_path, complaint, row=None):
         if self.check_nostore(tender, complaint_path, complaint):
             return
 
-        if self.check_exists(tender, complaint_path, complaint):
+        if self.check_exists(tender, complaint_path, complaint, row):
+            return
+
+        self.patch_before_store(tender, complaint, complaint_path)
+        complaint_hash = self.complaint_hash(complaint)
+
+        # don't rewrite complaint if only other parts of tender were changed
+        if row and len(row) > 2 and row[2] == complaint_hash:
+            logger.info("Unchanged T=%s P=%s C=%s by hash DM=%s",
+                tender.id, complaint_path, complaint.id, tender.dateModified)
             return
 
         logger.info("Complaint T=%s P=%s C=%s DS=%s S=%s TS=%s DM=%s M=%s",
             tender.id, complaint_path, complaint.id, complaint.get('dateSubmitted', ''),
             complaint.status, tender.status, tender.dateModified, tender.get('mode', ''))
 
-        self.patch_before_store(tender, complaint, complaint_path)
-        self.store(complaint, complaint_path)
+        with metrics.timer('stage_seconds', stage='store'):
+            self.store(complaint, complaint_path, complaint_hash)
+        metrics.inc('complaints_stored_total')
 
-    @retry(tries=3, delay=10, logger=logger)
+    @retry(tries=3, delay=2, logger=logger)
     def get_tender_data(self, tender_id):
         self.reset_watchdog()
-        tender = self.client.get_tender(tender_id)
-        return tender['data']
+        with metrics.timer('stage_seconds', stage='get_tender_data'):
+            tender = self.client.get_tender(tender_id)
+        return extract_tender(tender['data'], self.store_tender_fields)
 
-    def process_tender(self, tender):
-        if self.client_config['use_cache'] and self.check_cache(tender):
-            logger.debug("Exists T=%s DM=%s by cache", tender.id, tender.dateModified)
-            self.skipped_count += 1
+    def fetch_tender(self, tender):
+        try:
+            return tender, self.get_tender_data(tender.id), None
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            return tender, None, e
+
+    def fetch_tenders(self, tenders):
+        """yield (tender, data, error) in feed order, download in parallel"""
+        if self.fetch_workers < 2:
+            for tender in tenders:
+                yield self.fetch_tender(tender)
             return
+        if not self.fetch_pool:
+            logger.info("Start %d fetch workers", self.fetch_workers)
+            self.fetch_pool = ThreadPool(self.fetch_workers)
+        window = deque()
+        for tender in tenders:
+            window.append(self.fetch_pool.apply_async(self.fetch_tender, (tender,)))
+            if len(window) >= 2 * self.fetch_workers:
+                yield self.wait_result(window.popleft())
+        while window:
+            yield self.wait_result(window.popleft())
 
-        logger.debug("Tender T=%s DM=%s", tender.id, tender.dateModified)
-        data = self.get_tender_data(tender.id)
+    def wait_result(self, result):
+        # don't block in get() w/o timeout, let signals be handled
+        while not result.ready():
+            result.wait(1)
+        return result.get()
 
-        for comp in data.get('complaints', []):
-            self.process_complaint(data, 'complaints', comp)
+    def iter_complaints(self, tender):
+        """yield (complaint_path, complaint) for all tender complaints"""
+        for comp in tender.get('complaints', []):
+            yield 'complaints', comp
 
-        for award in data.get('awards', []):
+        for award in tender.get('awards', []):
             if 'complaints' in award:
                 path = "awards/{}/complaints".format(award.id)
                 for comp in award.complaints:
-                    self.process_complaint(data, path, comp)
+                    yield path, comp
 
-        for qual in data.get('qualifications', []):
+        for qual in tender.get('qualifications', []):
             if hasattr(qual, 'complaints'):
                 path = "qualifications/{}/complaints".format(qual.id)
                 for comp in qual.complaints:
-                    self.process_complaint(data, path, comp)
+                    yield path, comp
+
+    def process_tender(self, tender, data=None):
+        if data is None:
+            if self.client_config['use_cache'] and self.check_cache(tender):
+                logger.debug("Exists T=%s DM=%s by cache", tender.id, tender.dateModified)
+                self.skipped_count += 1
+                return
+            logger.debug("Tender T=%s DM=%s", tender.id, tender.dateModified)
+            data = self.get_tender_data(tender.id)
+
+        complaints = list(self.iter_complaints(data))
+        if complaints:
+            with metrics.timer('stage_seconds', stage='check_exists'):
+                exists = self.get_exists_list(data, [comp for _, comp in complaints])
+            for path, comp in complaints:
+                self.process_complaint(data, path, comp, exists.get(comp.id))
 
         if self.client_config['use_cache']:
-            self.finish_tender(data)
+            with metrics.timer('stage_seconds', stage='finish_tender'):
+                self.finish_tender(data)
+                if self.client_config['final_cache']:
+                    self.finish_final(data, complaints)
+
+        self.store_processed(data.id, data.dateModified)
+
+        with metrics.timer('stage_seconds', stage='flush'):
+            self.flush()
+        metrics.inc('tenders_processed_total')
+
+    def filter_tenders(self, tenders_list):
+        """return tenders which should be downloaded"""
+        tenders = list()
+        for tender in tenders_list:
+            self.tenders_count += 1
+            if self.skip_until and self.skip_until > tender.dateModified:
+                logger.debug("Ignore T=%s DM=%s by skip_until", tender.id, tender.dateModified)
+                self.skipped_count += 1
+                continue
+            if self.feed_until and self.feed_until <= tender.dateModified:
+                logger.debug("Ignore T=%s DM=%s by feed_until", tender.id, tender.dateModified)
+                self.skipped_count += 1
+                continue
+            if self.use_final_cache() and self.final_tenders.check(tender.id, tender.dateModified):
+                logger.debug("Final T=%s DM=%s by cache", tender.id, tender.dateModified)
+                metrics.inc('final_skipped_total')
+                self.skipped_count += 1
+                continue
+            tenders.append(tender)
+        if not self.client_config['use_cache'] or not tenders:
+            return tenders
+        with metrics.timer('stage_seconds', stage='check_cache'):
+            cached = self.check_cache_list(tenders)
+        if not cached:
+            return tenders
+        for tender in tenders:
+            if tender.id in cached:
+                logger.debug("Exists T=%s DM=%s by cache", tender.id, tender.dateModified)
+                self.skipped_count += 1
+        return [t for t in tenders if t.id not in cached]
+
+    def filter_page(self, tenders_list, sleep_time=1):
+        """return tenders of feed page to process, if filter failed whole
+        page is tracked as failed so checkpoint is held until retried"""
+        try:
+            return self.filter_tenders(tenders_list)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            logger.error("Fail filter_tenders {}: {}".format(type(e), e))
+            self.sleep(10 * sleep_time)
+            self.handle_error(e)
+            self.track_failed(tenders_list, [t.id for t in tenders_list])
+            return list()
+
+    def process_tenders(self, tenders, sleep_time=1):
+        """download and process tenders in feed order, return ids of failed"""
+        if self.leases:
+            return self.process_leased(tenders, sleep_time)
+        return self.process_fetched(tenders, sleep_time)
+
+    def process_fetched(self, tenders, sleep_time=1):
+        failed = list()
+        for tender, data, error in self.fetch_tenders(tenders):
+            if self.should_stop:
+                break
+            try:
+                if error:
+                    raise error
+                logger.debug("Tender T=%s DM=%s", tender.id, tender.dateModified)
+                self.process_tender(tender, data)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                logger.error("Fail on {} error {}: {}".format(tender, type(e), e))
+                failed.append(tender.id)
+                self.sleep(10 * sleep_time)
+                self.handle_error(e)
+            else:
+                if self.leases:
+                    self.leases.done(tender.id, tender.dateModified)
+        return failed
+
+    def process_leased(self, tenders, sleep_time=1):
+        """process tenders claimed in shared lease table, tenders in flight
+        in other worker are processed after it finished or failed them"""
+        failed = list()
+        waiting = tenders
+        while waiting and not self.should_stop:
+            claimed, busy = list(), list()
+
+            # claim right before download, page could take longer than lease ttl
+            def claim_tenders(tenders):
+                for tender in tenders:
+                    state = self.leases.claim(tender.id, tender.dateModified)
+                    if state == 'claimed':
+                        claimed.append(tender)
+                        yield tender
+                    elif state == 'busy':
+                        busy.append(tender)
+                    else:
+                        logger.debug("Exists T=%s DM=%s by lease", tender.id,
+                            tender.dateModified)
+                        metrics.inc('lease_skipped_total')
+                        self.skipped_count += 1
+
+            try:
+                failed.extend(self.process_fetched(claim_tenders(waiting), sleep_time))
+            finally:
+                # release claimed but not processed, done ones are kept
+                for tender in claimed:
+                    self.leases.release(tender.id)
+            if busy:
+                logger.debug("Wait %d tenders in flight in other worker", len(busy))
+                metrics.inc('lease_waits_total')
+                self.sleep(1)
+            waiting = busy
+        return failed
+
+    def track_failed(self, tenders, failed):
+        failed = set(failed)
+        for tender in tenders:
+            if tender.id in self.dropped_ids:
+                continue
+            if tender.id in failed:
+                self.fail_tender(tender)
+            else:
+                self.failed_tenders.pop(tender.id, None)
+        self.dropped_ids.clear()
+        metrics.set('failed_tenders', len(self.failed_tenders))
+
+    def fail_tender(self, tender):
+        if not self.failed_tenders:
+            # first retry after interval, not on the next page
+            self.last_retry_time = time()
+        item, attempts = self.failed_tenders.pop(tender.id, (tender, 0))
+        self.failed_tenders[tender.id] = (tender, attempts + 1)
+
+    def track_dropped(self, tenders):
+        """track processed tenders as failed when their buffered writes
+        were dropped, so they are downloaded again and checkpoint is held"""
+        for tender in tenders:
+            self.fail_tender(tender)
+            self.dropped_ids.add(tender.id)
+        metrics.inc('dropped_tenders_total', len(tenders))
+        metrics.set('failed_tenders', len(self.failed_tenders))
+
+    def retry_failed(self, sleep_time=1):
+        """process failed tenders again once per retry_failed_interval,
+        drop ones failed more than retry_failed_max times, save held
+        checkpoint when none left"""
+        if not self.failed_tenders or self.should_stop:
+            return
+        if time() - self.last_retry_time < self.retry_failed_interval:
+            return
+        self.last_retry_time = time()
+        tenders = [item for item, attempts in self.failed_tenders.values()]
+        logger.info("Retry %d failed tenders", len(tenders))
+        self.track_failed(tenders, self.process_tenders(tenders, sleep_time))
+        for tender_id, (item, attempts) in self.failed_tenders.items():
+            if attempts > self.retry_failed_max:
+                logger.error("Drop T=%s DM=%s failed %d times", item.id,
+                    item.dateModified, attempts)
+                metrics.inc('failed_dropped_total')
+                self.failed_tenders.pop(tender_id)
+        metrics.set('failed_tenders', len(self.failed_tenders))
+        if not self.failed_tenders and self.held_page:
+            self.commit_page(self.held_page[0], self.held_page[1], sleep_time)
+
+    def commit_page(self, page_offset, date_modified, sleep_time=1):
+        """flush buffered writes and save feed checkpoint, return False on error"""
+        try:
+            with metrics.timer('stage_seconds', stage='flush'):
+                self.flush(force=True)
+            if page_offset and self.failed_tenders:
+                # restart should replay pages with failed tenders
+                logger.debug("Hold checkpoint O=%s by %d failed tenders", page_offset,
+                    len(self.failed_tenders))
+                self.held_page = (page_offset, date_modified)
+                self.feed_offset = page_offset
+            elif page_offset and not self.should_stop:
+                self.save_checkpoint(page_offset, date_modified)
+                self.feed_offset = page_offset
+                self.held_page = None
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            logger.error("Fail flush {}: {}".format(type(e), e))
+            self.sleep(10 * sleep_time)
+            self.handle_error(e)
+            return False
+        self.expire_cache()
+        return True
+
+    def log_progress(self, last_date):
+        metrics.set('tenders_count', self.tenders_count)
+        metrics.set('skipped_count', self.skipped_count)
+        metrics.set('cache_hits', self.tender_cache.hits)
+        metrics.set('cache_misses', self.tender_cache.misses)
+        metrics.set('final_tenders', len(self.final_tenders))
+        logger.info("Processed %d tenders %d skipped, cache %d hits %d misses, last %s",
+            self.tenders_count, self.skipped_count, self.tender_cache.hits,
+            self.tender_cache.misses, last_date)
 
     def process_all(self, sleep_time=1):
+        if self.prefetch_pages > 0:
+            return self.process_all_pipelined(sleep_time)
         while not self.should_stop:
             self.reset_watchdog()
-            self.ping_backend()
+            with metrics.timer('stage_seconds', stage='ping_backend'):
+                self.ping_backend()
             try:
                 feed = self.client_config['feed'] or 'changes'
-                tenders_list = self.client.get_tenders(feed=feed)
+                with metrics.timer('stage_seconds', stage='get_tenders'):
+                    tenders_list = self.client.get_tenders(feed=feed)
+                page_offset = self.client.params.get('offset')
             except (SystemExit, KeyboardInterrupt):
                 raise
             except Exception as e:
@@ -244,37 +745,81 @@ class ComplaintsClient(object):
             if not tenders_list:
                 break
 
-            tender = None
+            self.count_page(tenders_list)
 
-            for tender in tenders_list:
-                self.tenders_count += 1
-                if self.should_stop:
-                    break
-                if self.skip_until and self.skip_until > tender.dateModified:
-                    logger.debug("Ignore T=%s DM=%s by skip_until", tender.id, tender.dateModified)
-                    self.skipped_count += 1
-                    continue
-                try:
-                    self.process_tender(tender)
-                except (SystemExit, KeyboardInterrupt):
-                    raise
-                except Exception as e:
-                    logger.error("Fail on {} error {}: {}".format(tender, type(e), e))
-                    self.sleep(10 * sleep_time)
-                    self.handle_error(e)
+            tenders = self.filter_page(tenders_list, sleep_time)
 
-            if tender:
-                logger.info("Processed %d tenders %d skipped, last %s",
-                    self.tenders_count, self.skipped_count, tender.get('dateModified'))
-            else:
+            self.track_failed(tenders, self.process_tenders(tenders, sleep_time))
+            self.retry_failed(sleep_time)
+
+            self.commit_page(page_offset, tenders_list[-1].dateModified, sleep_time)
+
+            self.log_progress(tenders_list[-1].get('dateModified'))
+
+            if self.feed_until and tenders_list[-1].dateModified >= self.feed_until:
                 break
 
             if sleep_time:
                 self.sleep(sleep_time)
 
+    def process_all_pipelined(self, sleep_time=1):
+        feed = self.client_config['feed'] or 'changes'
+        done_offset = self.client.params.get('offset')
+        reader = FeedReader(self.client, feed, self.prefetch_pages)
+        reader.start()
+        try:
+            while not self.should_stop:
+                self.reset_watchdog()
+                try:
+                    tenders_list, page_offset, error = reader.get(timeout=1)
+                except Empty:
+                    continue
+
+                if error:
+                    logger.error("Fail get_tenders {}: {}".format(type(error), error))
+                    self.sleep(10 * sleep_time)
+                    self.handle_error(error)
+                    break
+
+                if not tenders_list:
+                    break
+
+                self.count_page(tenders_list)
+
+                with metrics.timer('stage_seconds', stage='ping_backend'):
+                    self.ping_backend()
+
+                tenders = self.filter_page(tenders_list, sleep_time)
+
+                self.track_failed(tenders, self.process_tenders(tenders, sleep_time))
+                self.retry_failed(sleep_time)
+
+                self.commit_page(page_offset, tenders_list[-1].dateModified, sleep_time)
+                done_offset = page_offset
+
+                self.log_progress(tenders_list[-1].get('dateModified'))
+
+                if self.feed_until and tenders_list[-1].dateModified >= self.feed_until:
+                    break
+
+                if sleep_time:
+                    self.sleep(sleep_time)
+        finally:
+            # keep watchdog alive while waiting, unless it is what stops us
+            reader.stop(idle=lambda: self.should_stop or self.reset_watchdog())
+            # reader could prefetch more pages than processed, so
+            # next process_all should continue after last processed page
+            if done_offset:
+                self.client.params['offset'] = done_offset
+            else:
+                self.client.params.pop('offset', None)
+
     def need_clear_cache(self):
         if not self.client_config.get('use_cache', False):
             return False
+        # entries expire by cache_ttl, don't truncate whole cache
+        if self.cache_ttl:
+            return False
         if datetime.now().isoweekday() == self.clear_cache_wday:
             return self.need_reset_client()
 
@@ -287,18 +832,111 @@ class ComplaintsClient(object):
         if self.descending_mode:
             logger.warning("Don't rewind in descending_mode")
             return
+        if minus_days:
+            date = parse_date(skip_until) - timedelta(days=minus_days)
+            skip_until = date.strftime("%Y-%m-%d")
+        logger.info("Start fast_rewind to %s", skip_until)
+        self.rewind_requests = 0
+        start_time = time()
+        try:
+            offset = self.gallop_rewind(skip_until)
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            logger.error("Failed gallop rewind %s %s", type(e), str(e))
+            offset = None
+        if offset is not None:
+            self.client.params['offset'] = offset
+            logger.info("Rewind success to %s offset %s", skip_until, offset)
+        else:
+            self.page_rewind(skip_until)
+        logger.info("Rewind done in %d requests %1.1f sec", self.rewind_requests,
+            time() - start_time)
+
+    def probe_feed(self, offset=None, descending=False):
+        """return (dateModified, next_offset) of first changes feed item after offset"""
+        params = dict(self.client.params)
+        self.client.params.pop('offset', None)
+        self.client.params.pop('descending', None)
+        try:
+            probe = {'limit': 1}
+            if offset is not None:
+                probe['offset'] = offset
+            if descending:
+                probe['descending'] = "1"
+            self.reset_watchdog()
+            self.rewind_requests += 1
+            tenders_list = self.client.get_tenders(probe, feed='changes')
+            if not tenders_list:
+                return None, None
+            return tenders_list[0]['dateModified'], self.client.params.get('offset')
+        finally:
+            self.client.params.clear()
+            self.client.params.update(params)
+
+    def probe_offset(self, offset):
+        """return dateModified of first changes feed item after numeric offset,
+        raise ValueError if feed doesn't continue with greater numeric offset"""
+        date, next_offset = self.probe_feed(offset)
+        if not date:
+            return None
+        if numeric_offset(next_offset) is None or numeric_offset(next_offset) <= offset:
+            raise ValueError("Feed offset %r after %d isn't numeric" % (next_offset, offset))
+        return date
+
+    def gallop_rewind(self, skip_until):
+        """find changes feed offset before skip_until by exponential probes and bisection,
+        return None if feed offsets are not increasing numbers, e.g. opaque sequences"""
+        top_date, top_offset = self.probe_feed(descending=True)
+        if not top_date:
+            return None
+        top = numeric_offset(top_offset)
+        if top is None:
+            logger.info("Feed offset %s is not numeric, can't gallop", top_offset)
+            return None
+        if top_date < skip_until:
+            return top
+        try:
+            return self.gallop_bisect(skip_until, top)
+        except ValueError as e:
+            logger.info("Can't gallop, %s", e)
+            return None
+
+    def gallop_bisect(self, skip_until, top):
+        page_size = int(self.client_config['limit'] or 100)
+        step, lo, hi = page_size, None, top
+        # gallop back from the top with growing steps until passed skip_until
+        while lo is None:
+            offset = max(hi - step, 0)
+            date = self.probe_offset(offset)
+            if date and date < skip_until:
+                lo = offset
+            elif offset == 0:
+                return 0
+            else:
+                logger.debug("Rewind gallop offset %d last %s", offset, date)
+                hi = offset
+                step *= 2
+        # bisect until distance is less than one page
+        while hi - lo > page_size:
+            mid = (lo + hi) // 2
+            date = self.probe_offset(mid)
+            if date and date < skip_until:
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def page_rewind(self, skip_until):
         date = datetime.now() - timedelta(days=10)
         if skip_until < date.strftime("%Y-%m-%d"):
             logger.info("Current skip_until %s is too old for fast_rewind", skip_until)
             return
-        if minus_days:
-            date = parse_date(skip_until) - timedelta(days=minus_days)
-            skip_until = date.strftime("%Y-%m-%d")
         self.client.params.pop('offset', None)
         self.client.params['descending'] = "1"
-        logger.info("Start fast_rewind to %s", skip_until)
         for i in range(101):
             self.reset_watchdog()
+            self.rewind_requests += 1
             try:
                 tenders_list = self.client.get_tenders()
             except StandardError:
@@ -330,6 +968,9 @@ class ComplaintsClient(object):
         if not self.client_config['fast_rewind']:
             logger.info("fast_rewind disabled in config, offset not changed")
             return
+        if self.feed_offset:
+            logger.info("Feed offset restored from checkpoint, offset not changed")
+            return
         if self.client_config['feed'] == 'dateModified':
             self.client.params['offset'] = self.skip_until
         if self.client_config['feed'] == 'changes':
@@ -352,14 +993,14 @@ class ComplaintsClient(object):
             self.fast_update_offset()
 
     @retry(tries=5, delay=1, logger=logger)
-    def reset_client(self, full_reset=False):
+    def reset_client(self, full_reset=False, restore_offset=True):
         logger.info("Reset client {}".format(self.client_config))
         if self.client_config['mode'] not in ['', '_all_', 'test']:
             logger.warning("Unknown client mode '%s'", self.client_config['mode'])
         if self.client_config['feed'] not in ['changes', 'dateModified']:
             logger.warning("Unknown client feed '%s'", self.client_config['feed'])
-        if self.conf_timeout:
-            socket.setdefaulttimeout(self.conf_timeout)
+        if self.client_config['transport'] not in ['restkit', 'requests']:
+            logger.warning("Unknown client transport '%s'", self.client_config['transport'])
         client_options = {
             'key': self.client_config['key'],
             'host_url': self.client_config['host_url'],
@@ -370,19 +1011,59 @@ class ComplaintsClient(object):
             },
             'user_agent': 'Complaints/0.6 '+self.client_config['user_agent'],
             'timeout': self.conf_timeout,
+            'governor': self.governor,
         }
         if self.descending_mode:
             client_options['params']['descending'] = "1"
-        self.client = SafeTendersClient(**client_options)
+        if getattr(self, 'client', None) and hasattr(self.client, 'close'):
+            self.client.close()
+        if self.client_config['transport'] == 'requests':
+            from openprocurement.complaints.queue.transport import PooledTendersClient
+            client_options['pool_size'] = max(self.fetch_workers, 2)
+            self.client = PooledTendersClient(**client_options)
+        else:
+            if self.conf_timeout:
+                socket.setdefaulttimeout(self.conf_timeout)
+            self.client = SafeTendersClient(**client_options)
         self.last_reset_time = time()
+        metrics.inc('client_resets_total')
         self.client_errors = 0
         self.tenders_count = 0
         self.skipped_count = 0
-        self.fast_update_offset()
+        # backward worker starts from the top of feed after daily reset
+        if full_reset and self.descending_mode:
+            self.feed_offset = None
+            self.held_page = None
+            self.clear_checkpoint()
+        if restore_offset:
+            self.restore_feed_offset()
+
+    def open_feed(self):
+        """resume from saved checkpoint w/o rewind, otherwise rewind feed
+        to skip_until restored from database or config"""
+        if self.restore_checkpoint():
+            return
+        skip_until = self.skip_until
+        self.restore_skip_until()
+        # set_skip_until already rewound feed if skip_until was changed
+        if self.skip_until == skip_until:
+            self.fast_update_offset()
+
+    def restore_feed_offset(self):
+        if self.feed_offset:
+            logger.info("Resume %s worker from offset %s", self.worker_name, self.feed_offset)
+            self.client.params['offset'] = self.feed_offset
+        else:
+            self.fast_update_offset()
 
     def handle_error(self, error):
+        metrics.inc('errors_total', error=type(error).__name__)
         self.client_errors += 1
-        if self.client_errors >= 3:
+        if self.client_errors >= 3 and self.governor.overloaded:
+            # new connections won't help throttled or failing API
+            logger.warning("Don't reset client while API is overloaded")
+            self.client_errors = 0
+        elif self.client_errors >= 3:
             self.reset_client()
 
     def run(self):
@@ -391,5 +1072,11 @@ class ComplaintsClient(object):
                 self.clear_cache()
             if self.need_reset_client():
                 self.reset_client(True)
+            self.feed_items = self.feed_full_pages = 0
             self.process_all()
-            self.sleep(self.conf_sleep)
+            self.retry_failed()
+            interval = self.scheduler.next_interval(self.feed_items, self.feed_full_pages)
+            metrics.set('poll_interval_seconds', interval)
+            logger.debug("Sleep %1.1f sec, got %d items %d full pages", interval,
+                self.feed_items, self.feed_full_pages)
+            self.sleep(interval)
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+from time import time
+from collections import OrderedDict
+import simplejson as json
+from openprocurement.complaints.queue.client import ComplaintsClient
+from openprocurement.complaints.queue.feed import FeedItem
+from openprocurement.complaints.queue.utils import compress_json
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ComplaintsToDatabase(ComplaintsClient):
+    """Buffered writer and feed checkpoints shared by SQL backends.
+
+    Subclass sets table_name, flush_size, flush_interval, compress and
+    compress_min, defines create_cursor, create_tables, save_checkpoint,
+    expire_cache_list and write_buffers, which writes all buffers in
+    current transaction w/o commit, then calls open_database."""
+
+    store_columns = ['tender_id', 'tender_status', 'tender_procurementMethod',
+        'tender_procurementMethodType', 'tender_dateModified', 'tender_mode',
+        'complaint_id', 'complaint_complaintID', 'complaint_path',
+        'complaint_acceptance', 'complaint_dateSubmitted', 'complaint_dateAccepted',
+        'complaint_status', 'complaint_json', 'complaint_hash', 'complaint_format']
+
+    update_columns = ['tender_status', 'tender_dateModified', 'complaint_status',
+        'complaint_acceptance', 'complaint_dateAccepted', 'complaint_json', 'complaint_hash',
+        'complaint_format']
+
+    # DB-API paramstyle of driver
+    placeholder = '%s'
+    # base exception of driver
+    db_error = Exception
+    # cache updated_at as unix time
+    updated_at_sql = 'updated_at'
+    clear_cache_sql = "DELETE FROM {table_name}_cache"
+    # truncate complaints longer than max_packet, 0 means no limit
+    max_packet = 0
+    cache_chunk_size = 500
+    flush_max_errors = 3
+
+    def __init__(self, client_config=None):
+        super(ComplaintsToDatabase, self).__init__(client_config)
+        self.store_buffer = list()
+        self.cache_buffer = list()
+        self.final_buffer = list()
+        self.processed_buffer = list()
+        self.last_flush_time = time()
+        self.flush_errors = 0
+
+    def open_database(self):
+        self.create_cursor()
+        self.create_tables()
+        if self.client_config['use_cache'] and self.client_config['cache_preload']:
+            self.preload_cache()
+        if self.use_final_cache():
+            self.load_final_tenders()
+        self.open_feed()
+
+    def execute_query(self, sql, *args):
+        return self.cursor.execute(sql.format(table_name=self.table_name), *args)
+
+    def executemany_query(self, sql, args):
+        return self.cursor.executemany(sql.format(table_name=self.table_name), args)
+
+    def query_and_fetchone(self, sql, *args):
+        self.execute_query(sql, *args)
+        return self.cursor.fetchone()
+
+    def placeholders(self, count):
+        return ", ".join([self.placeholder] * count)
+
+    def stream_cursor(self):
+        """cursor for reading whole table w/o fetching it to memory"""
+        return self.dbcon.cursor()
+
+    def iter_query(self, sql, *args):
+        cursor = self.stream_cursor()
+        try:
+            cursor.execute(sql.format(table_name=self.table_name), *args)
+            for n, row in enumerate(cursor):
+                if n % 10000 == 0:
+                    self.reset_watchdog()
+                yield row
+        finally:
+            cursor.close()
+
+    def rollback(self):
+        try:
+            self.dbcon.rollback()
+        except self.db_error:
+            pass
+
+    def clear_cache(self):
+        if getattr(self, 'dbcon', None) is None:
+            return
+        logger.warning("Clear cache table '%s_cache'", self.table_name)
+        self.tender_cache.clear()
+        try:
+            self.execute_query(self.clear_cache_sql)
+            self.dbcon.commit()
+        except self.db_error as e:
+            logger.error("Can't clear cache %s", str(e))
+            self.rollback()
+
+    def preload_cache(self):
+        if not self.tender_cache.size:
+            return
+        logger.info("Preload cache from '%s_cache'", self.table_name)
+        for row in self.iter_query(("SELECT tender_id, tender_dateModified, tender_status, " +
+                "%s FROM {table_name}_cache LIMIT %s") % (self.updated_at_sql, self.placeholder),
+                (self.tender_cache.size,)):
+            self.tender_cache.set(row[0], row[1], self.cache_expires(row[2], row[3]))
+        logger.info("Preloaded %d tenders to cache", len(self.tender_cache))
+
+    def load_final_tenders(self):
+        logger.info("Load final tenders from '%s_final'", self.table_name)
+        for row in self.iter_query("SELECT tender_id, tender_dateModified FROM {table_name}_final"):
+            self.final_tenders.add(row[0], row[1])
+        logger.info("Loaded %d final tenders", len(self.final_tenders))
+
+    def iter_processed(self):
+        # tender_dateModified of complaints isn't updated if only other parts of
+        # tender were changed, cache and final tables keep last processed one
+        for suffix in ('', '_cache', '_final', '_processed'):
+            for row in self.iter_query("SELECT tender_id, tender_dateModified " +
+                    "FROM {table_name}" + suffix):
+                yield row
+
+    def restore_checkpoint(self):
+        row = self.query_and_fetchone(("SELECT feed, feed_offset, last_dateModified " +
+            "FROM {table_name}_offset WHERE worker_name=%s LIMIT 1") % self.placeholder,
+            (self.worker_name,))
+        if not row or not row[1]:
+            return False
+        feed = self.client_config['feed'] or 'changes'
+        if row[0] != feed:
+            logger.info("Ignore checkpoint for feed '%s' current feed '%s'", row[0], feed)
+            return False
+        logger.info("Restore checkpoint %s offset %s last %s", self.worker_name, row[1], row[2])
+        self.feed_offset = row[1]
+        self.restore_feed_offset()
+        return True
+
+    def clear_checkpoint(self):
+        logger.info("Clear checkpoint %s", self.worker_name)
+        try:
+            self.execute_query("DELETE FROM {table_name}_offset WHERE worker_name=%s" %
+                self.placeholder, (self.worker_name,))
+            self.dbcon.commit()
+        except self.db_error as e:
+            logger.error("Can't clear checkpoint %s", str(e))
+            self.rollback()
+
+    def restore_skip_until(self):
+        if self.descending_mode:
+            return
+        row = self.query_and_fetchone("SELECT MAX(complaint_dateSubmitted) FROM {table_name}")
+        if not row or not row[0]:
+            return
+        row_date = row[0][:10]
+        if row_date < self.skip_until:
+            logger.info("Ignore offset from database '%s' use from config '%s'",
+                row_date, self.skip_until)
+            return
+        logger.info("Restore offset from database '%s'", row_date)
+        self.set_skip_until(row_date, minus_days=1)
+
+    def get_cache_list(self, tenders_list):
+        cached = dict()
+        tender_ids = list(set([t.id for t in tenders_list]))
+        for i in range(0, len(tender_ids), self.cache_chunk_size):
+            chunk = tender_ids[i:i+self.cache_chunk_size]
+            SQL = ("SELECT tender_id, tender_dateModified, tender_status, %s " +
+                   "FROM {table_name}_cache WHERE tender_id IN (%s)") % (
+                   self.updated_at_sql, self.placeholders(len(chunk)))
+            self.execute_query(SQL, chunk)
+            for row in self.cursor.fetchall():
+                cached[row[0]] = (row[1], self.cache_expires(row[2], row[3]))
+        return cached
+
+    def get_exists_list(self, tender, complaints):
+        complaint_ids = list(set([c.id for c in complaints]))
+        SQL = ("SELECT complaint_id, tender_status, tender_dateModified, complaint_hash " +
+               "FROM {table_name} WHERE complaint_id IN (%s)" % self.placeholders(len(complaint_ids)))
+        self.execute_query(SQL, complaint_ids)
+        return dict([(row[0], row[1:]) for row in self.cursor.fetchall()])
+
+    def store_final(self, tender_id, date_modified):
+        self.final_buffer.append((tender_id, date_modified))
+
+    def store_processed(self, tender_id, date_modified):
+        self.processed_buffer.append((tender_id, date_modified))
+
+    def finish_tender(self, tender):
+        self.cache_buffer.append((tender.id, tender.dateModified, tender.get('status')))
+
+    def buffered_tenders(self):
+        """return FeedItem of each tender with rows in write buffers"""
+        tenders = OrderedDict()
+        id_index = self.store_columns.index('tender_id')
+        date_index = self.store_columns.index('tender_dateModified')
+        for row in self.store_buffer:
+            tenders[row[id_index]] = row[date_index]
+        for tender_id, date_modified in [r[:2] for r in self.cache_buffer] + \
+                self.final_buffer + self.processed_buffer:
+            if date_modified:
+                tenders[tender_id] = date_modified
+        return [FeedItem(k, v) for k, v in tenders.items()]
+
+    def flush(self, force=False):
+        buffered = len(self.store_buffer) + len(self.cache_buffer) + \
+            len(self.final_buffer) + len(self.processed_buffer)
+        if not buffered:
+            self.last_flush_time = time()
+            return
+        if not force and buffered < self.flush_size and \
+                time() - self.last_flush_time < self.flush_interval:
+            return
+        try:
+            self.write_buffers()
+            self.dbcon.commit()
+        except self.db_error:
+            self.flush_errors += 1
+            self.rollback()
+            # buffers are kept for next flush unless it fails again and again
+            if self.flush_errors >= self.flush_max_errors:
+                dropped = self.buffered_tenders()
+                logger.error("Drop %d complaints of %d tenders after %d flush errors, " +
+                    "retry tenders later", len(self.store_buffer), len(dropped),
+                    self.flush_errors)
+                self.track_dropped(dropped)
+                for row in self.cache_buffer:
+                    self.tender_cache.discard(row[0])
+                self.store_buffer, self.cache_buffer = list(), list()
+                self.final_buffer, self.processed_buffer = list(), list()
+                self.flush_errors = 0
+            raise
+        logger.debug("Flush %d complaints %d tenders", len(self.store_buffer),
+            len(self.cache_buffer))
+        self.tender_cache.update([(tender_id, date_modified, self.cache_expires(status))
+            for tender_id, date_modified, status in self.cache_buffer])
+        self.store_buffer, self.cache_buffer = list(), list()
+        self.final_buffer, self.processed_buffer = list(), list()
+        self.last_flush_time = time()
+        self.flush_errors = 0
+
+    def encode_complaint(self, complaint):
+        complaint_json = json.dumps(complaint)
+        if self.compress:
+            return compress_json(complaint_json, self.compress_min)
+        return complaint_json, 'json'
+
+    def store(self, complaint, complaint_path, complaint_hash=None):
+        complaint_json, complaint_format = self.encode_complaint(complaint)
+        if self.max_packet and len(complaint_json) > 65000:
+            logger.warning("Too big T=%s P=%s C=%s size=%d", complaint.tender.id,
+                complaint_path, complaint.id, len(complaint_json))
+        if self.max_packet and len(complaint_json) > self.max_packet:
+            max_title = int(self.max_packet / 125)
+            max_descr = int(self.max_packet / 6.25)
+            complaint.title = complaint.title[:max_title] + " (truncated)"
+            complaint.description = complaint.description[:max_descr] + " (truncated)"
+            complaint_json, complaint_format = self.encode_complaint(complaint)
+            logger.warning("Complaint T=%s P=%s C=%s truncated to size=%d",
+                complaint.tender.id, complaint_path, complaint.id, len(complaint_json))
+        insert_data = dict([
+            ('tender_id', complaint.tender.id),
+            ('tender_status', complaint.tender.status),
+            ('tender_procurementMethod', complaint.tender.procurementMethod),
+            ('tender_procurementMethodType', complaint.tender.procurementMethodType),
+            ('tender_dateModified', complaint.tender.dateModified),
+            ('tender_mode', complaint.tender.get('mode', None)),
+            ('complaint_id', complaint.id),
+            ('complaint_complaintID', complaint.complaintID),
+            ('complaint_path', complaint_path),
+            ('complaint_acceptance', complaint.get('acceptance', None)),
+            ('complaint_dateSubmitted', complaint.get('dateSubmitted', None)),
+            ('complaint_dateAccepted',  complaint.get('dateAccepted', None)),
+            ('complaint_status', complaint.status),
+            ('complaint_json', complaint_json),
+            ('complaint_hash', complaint_hash),
+            ('complaint_format', complaint_format),
+        ])
+        self.store_buffer.append(tuple([insert_data[k] for k in self.store_columns]))
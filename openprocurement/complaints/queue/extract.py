@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from munch import Munch, munchify
+
+
+class TenderData(Munch):
+    """Part of tender needed to process complaints"""
+
+    def lot_status(self, lot_id):
+        # index lots once per tender, not per complaint
+        index = self.__dict__.get('_lot_status')
+        if index is None:
+            index = dict([(lot.id, lot.status) for lot in self.get('lots', [])])
+            object.__setattr__(self, '_lot_status', index)
+        return index.get(lot_id)
+
+
+def extract_parent(item):
+    """award or qualification with its complaints only"""
+    parent = Munch(id=item['id'], status=item.get('status'))
+    if 'complaints' in item:
+        parent['complaints'] = munchify(item['complaints'])
+    return parent
+
+
+def extract_tender(data, fields):
+    """return TenderData from decoded tender json, only fields, complaints,
+    awards and qualifications complaints and lots statuses are munchified,
+    bids, documents, items and the rest are dropped"""
+    tender = TenderData()
+    for k in fields:
+        if k in data:
+            tender[k] = munchify(data[k])
+    if 'complaints' in data:
+        tender['complaints'] = munchify(data['complaints'])
+    for k in ('awards', 'qualifications'):
+        if k in data:
+            tender[k] = [extract_parent(item) for item in data[k]]
+    if 'lots' in data:
+        tender['lots'] = [Munch(id=lot['id'], status=lot.get('status'))
+            for lot in data['lots']]
+    return tender
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from simplejson import loads
+
+
+class FeedItem(object):
+    """Compact tenders feed record, attribute and item access like Munch"""
+
+    __slots__ = ('id', 'dateModified')
+
+    def __init__(self, id, dateModified):
+        self.id = id
+        self.dateModified = dateModified
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        return isinstance(other, FeedItem) and \
+            (self.id, self.dateModified) == (other.id, other.dateModified)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "FeedItem(id=%r, dateModified=%r)" % (self.id, self.dateModified)
+
+
+def feed_item_hook(obj):
+    if 'id' in obj and 'dateModified' in obj:
+        return FeedItem(obj['id'], obj['dateModified'])
+    return obj
+
+
+def parse_feed_page(body):
+    """return (data, next_page) of feed page, data is list of FeedItem
+    built by simplejson decoder hook w/o intermediate Munch objects"""
+    page = loads(body, object_hook=feed_item_hook)
+    return page.get('data', []), page.get('next_page', {})
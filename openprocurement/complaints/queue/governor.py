@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from time import time
+from threading import Condition
+from contextlib import contextmanager
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Governor(object):
+    """Shared limiter of API requests made by feed reader and fetch workers,
+    concurrency and rate grow additively on success and are cut
+    multiplicatively on throttling, server errors or slow responses,
+    consecutive failures open circuit and requests wait until it cools down"""
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+    state_names = ('closed', 'half-open', 'open')
+
+    def __init__(self, max_concurrency=2, rate_max=0, rate_min=0.5, rate_step=1.0,
+                 slow_request=10, circuit_errors=5, circuit_timeout=10, circuit_max=300,
+                 stopped=None, idle=None):
+        self.cond = Condition()
+        self.stopped = stopped
+        self.idle = idle
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.limit = self.max_concurrency
+        self.rate_max = float(rate_max or 0)
+        self.rate_min = float(rate_min or 0.1)
+        self.rate_step = float(rate_step or 1)
+        self.rate = self.rate_max or float('inf')
+        self.slow_request = float(slow_request or 0)
+        self.circuit_errors = max(int(circuit_errors), 1)
+        self.circuit_timeout = float(circuit_timeout)
+        self.circuit_max = max(float(circuit_max), self.circuit_timeout)
+        self.open_timeout = self.circuit_timeout
+        self.state = self.CLOSED
+        self.open_until = 0
+        self.probing = False
+        self.active = 0
+        self.successes = 0
+        self.failures = 0
+        self.next_time = 0
+        self.last_decrease = 0
+        self.last_throttle = 0
+        self.latency = 0.0
+        self.throughput = 0.0
+        self.window_start = time()
+        self.window_count = 0
+        self.update_metrics()
+
+    @property
+    def overloaded(self):
+        """True while circuit isn't closed or soon after throttling"""
+        return self.state != self.CLOSED or \
+            time() - self.last_throttle < self.circuit_timeout
+
+    def update_metrics(self):
+        # rate limit 0 means unlimited
+        metrics.set('api_rate_limit', self.rate if self.rate != float('inf') else 0)
+        metrics.set('api_concurrency_limit', self.limit)
+        metrics.set('api_circuit_state', self.state)
+        metrics.set('api_latency_ewma_seconds', round(self.latency, 4))
+
+    def wait_slot(self, now):
+        """return seconds to wait or 0 if request may be started"""
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                return self.open_until - now
+            self.state = self.HALF_OPEN
+            logger.info("API circuit half-open, probe request")
+            self.update_metrics()
+        if self.state == self.HALF_OPEN:
+            return 0 if not self.probing else 1.0
+        if self.active >= self.limit:
+            return 1.0
+        if self.next_time > now:
+            return self.next_time - now
+        return 0
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = time()
+                delay = self.wait_slot(now)
+                if not delay:
+                    break
+                if self.stopped and self.stopped():
+                    raise CircuitOpenError("Stopped while waiting API %s" %
+                        self.state_names[self.state])
+                if self.idle:
+                    self.idle()
+                self.cond.wait(min(delay, 1.0))
+            if self.state == self.HALF_OPEN:
+                self.probing = True
+            if self.rate != float('inf'):
+                self.next_time = max(now, self.next_time) + 1.0 / self.rate
+            self.active += 1
+
+    def release(self, latency, result):
+        """result is one of ok, slow, throttled, error or cancelled"""
+        metrics.inc('api_requests_total', result=result)
+        with self.cond:
+            now = time()
+            self.active -= 1
+            self.latency = 0.8 * self.latency + 0.2 * latency if self.latency else latency
+            self.window_count += 1
+            if now - self.window_start >= 1.0:
+                current = self.window_count / (now - self.window_start)
+                self.throughput = 0.7 * self.throughput + 0.3 * current \
+                    if self.throughput else current
+                self.window_start, self.window_count = now, 0
+            if result == 'cancelled':
+                self.probing = False
+            elif result in ('ok', 'slow'):
+                self.on_success(now, result)
+            else:
+                self.on_failure(now, result)
+            self.update_metrics()
+            self.cond.notify_all()
+
+    def on_success(self, now, result):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info("API circuit closed after %s probe", result)
+            self.state = self.CLOSED
+            self.probing = False
+            self.open_timeout = self.circuit_timeout
+        if result == 'slow':
+            return self.decrease(now, "slow response %1.1f sec" % self.latency)
+        self.successes += 1
+        if self.successes < self.limit:
+            return
+        self.successes = 0
+        if self.limit < self.max_concurrency:
+            self.limit += 1
+        if self.rate != float('inf'):
+            self.rate += self.rate_step
+            if self.rate_max and self.rate > self.rate_max:
+                self.rate = self.rate_max
+
+    def on_failure(self, now, result):
+        self.failures += 1
+        if result == 'throttled':
+            self.last_throttle = now
+        if self.state == self.HALF_OPEN:
+            self.probing = False
+            self.open_timeout = min(2 * self.open_timeout, self.circuit_max)
+            return self.open_circuit(now, result)
+        if self.failures >= self.circuit_errors and self.state == self.CLOSED:
+            return self.open_circuit(now, result)
+        self.decrease(now, result)
+
+    def decrease(self, now, reason):
+        # one cut per round trip, burst of failures of the same requests counts once
+        if now - self.last_decrease < max(self.latency, 1.0):
+            return
+        self.last_decrease = now
+        self.successes = 0
+        self.limit = max(self.limit // 2, 1)
+        current = self.throughput or self.limit / max(self.latency, 0.1)
+        self.rate = max(min(self.rate, current) / 2.0, self.rate_min)
+        logger.warning("Throttle API requests to %1.1f/s concurrency %d after %s",
+            self.rate, self.limit, reason)
+
+    def open_circuit(self, now, reason):
+        self.state = self.OPEN
+        self.open_until = now + self.open_timeout
+        self.limit = 1
+        self.rate = max(self.rate_min, min(self.rate, self.rate_step))
+        metrics.inc('api_circuit_opened_total')
+        logger.error("API circuit open for %d sec after %d failures, last %s",
+            self.open_timeout, self.failures, reason)
+
+    def classify(self, error):
+        status = getattr(error, 'status_int', None)
+        if status in (429, 503):
+            return 'throttled'
+        if status is None or status >= 500:
+            return 'error'
+        # server answered with client error, it's alive
+        return 'ok'
+
+    @contextmanager
+    def request(self):
+        self.acquire()
+        start = time()
+        try:
+            yield
+        except Exception as e:
+            self.release(time() - start, self.classify(e))
+            raise
+        except BaseException:
+            self.release(time() - start, 'cancelled')
+            raise
+        latency = time() - start
+        if self.slow_request and latency > self.slow_request:
+            self.release(latency, 'slow')
+        else:
+            self.release(latency, 'ok')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+import ctypes
+from time import time
+from multiprocessing import Array
+from openprocurement.complaints.queue.cache import FinalTenders
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+CLAIMED, BUSY, DONE = 'claimed', 'busy', 'done'
+
+
+class Lease(ctypes.Structure):
+    # owner is pid of worker processing tender, 0 means done
+    _fields_ = [
+        ('key', ctypes.c_uint64),
+        ('value', ctypes.c_uint32),
+        ('owner', ctypes.c_int32),
+        ('expires', ctypes.c_double),
+    ]
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class LeaseTable(object):
+    """Shared memory hash table of tenders in flight, created by watcher
+    before fork so forward and backward workers don't fetch same tender,
+    finished tenders stay as done for done_ttl seconds"""
+
+    max_probes = 32
+
+    def __init__(self, size=4096, ttl=120, done_ttl=600):
+        self.size = max(int(size), self.max_probes)
+        self.ttl = float(ttl)
+        self.done_ttl = float(done_ttl)
+        self.shared = Array(Lease, self.size)
+        self.lock = self.shared.get_lock()
+        self.table = self.shared.get_obj()
+
+    def slots(self, key):
+        for i in range(self.max_probes):
+            yield self.table[(key + i) % self.size]
+
+    def find(self, key, owner):
+        for slot in self.slots(key):
+            if slot.key == key and slot.owner == owner:
+                return slot
+        return None
+
+    def claim(self, tender_id, date_modified):
+        """return CLAIMED if tender may be processed, BUSY if it is in flight
+        in other worker, DONE if it was processed with same dateModified"""
+        key = FinalTenders.key(tender_id)
+        value = FinalTenders.value(date_modified)
+        pid = os.getpid()
+        with self.lock:
+            now = time()
+            free = None
+            for slot in self.slots(key):
+                if slot.key == key:
+                    if slot.expires > now:
+                        if not slot.owner and slot.value == value:
+                            return DONE
+                        if slot.owner and slot.owner != pid and pid_alive(slot.owner):
+                            return BUSY
+                    free = slot
+                    break
+                if free is None and slot.expires <= now:
+                    free = slot
+            if free is None:
+                # table is full, don't block processing
+                metrics.inc('lease_table_full_total')
+                return CLAIMED
+            free.key, free.value, free.owner = key, value, pid
+            free.expires = now + self.ttl
+            return CLAIMED
+
+    def done(self, tender_id, date_modified):
+        with self.lock:
+            slot = self.find(FinalTenders.key(tender_id), os.getpid())
+            if slot:
+                slot.owner = 0
+                slot.value = FinalTenders.value(date_modified)
+                slot.expires = time() + self.done_ttl
+
+    def release(self, tender_id):
+        with self.lock:
+            slot = self.find(FinalTenders.key(tender_id), os.getpid())
+            if slot:
+                slot.owner = 0
+                slot.expires = 0
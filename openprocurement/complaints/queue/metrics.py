@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import os
+from time import time, sleep
+from threading import Lock, Thread
+from contextlib import contextmanager
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Metrics(object):
+    """Counters, gauges and latency histograms in Prometheus text format"""
+
+    prefix = 'complaints_'
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self):
+        self.lock = Lock()
+        self.labels = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.histograms = dict()
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time()
+        try:
+            yield
+        finally:
+            self.observe(name, time() - start, **labels)
+
+    def format_labels(self, labels, extra=()):
+        labels = tuple(sorted(self.labels.items())) + labels + extra
+        if not labels:
+            return ''
+        return '{' + ','.join(['%s="%s"' % kv for kv in labels]) + '}'
+
+    def render(self):
+        lines = list()
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted(set([k[0] for k in values])):
+                    lines.append('# TYPE %s%s %s' % (self.prefix, name, kind))
+                    for key in sorted([k for k in values if k[0] == name]):
+                        lines.append('%s%s%s %s' % (self.prefix, name,
+                            self.format_labels(key[1]), values[key]))
+            for name in sorted(set([k[0] for k in self.histograms])):
+                lines.append('# TYPE %s%s histogram' % (self.prefix, name))
+                for key in sorted([k for k in self.histograms if k[0] == name]):
+                    counts, total, count = self.histograms[key]
+                    for le, n in zip(self.buckets, counts):
+                        lines.append('%s%s_bucket%s %d' % (self.prefix, name,
+                            self.format_labels(key[1], (('le', str(le)),)), n))
+                    lines.append('%s%s_bucket%s %d' % (self.prefix, name,
+                        self.format_labels(key[1], (('le', '+Inf'),)), count))
+                    lines.append('%s%s_sum%s %f' % (self.prefix, name,
+                        self.format_labels(key[1]), total))
+                    lines.append('%s%s_count%s %d' % (self.prefix, name,
+                        self.format_labels(key[1]), count))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+# extra endpoint commands path -> callable(**query) returning text
+commands = dict()
+
+
+def register_command(path, func):
+    commands[path] = func
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send_text(self, code, body):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in commands:
+            query = dict([(k, v[0]) for k, v in parse_qs(url.query).items()])
+            try:
+                return self.send_text(200, commands[url.path](**query))
+            except Exception as e:
+                return self.send_text(400, "%s: %s\n" % (type(e).__name__, e))
+        if url.path not in ('/', '/metrics'):
+            return self.send_text(404, 'Not found\n')
+        return self.send_text(200, metrics.render())
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    server = HTTPServer((host, int(port)), MetricsHandler)
+    thread = Thread(target=server.serve_forever, name='MetricsServer')
+    thread.daemon = True
+    thread.start()
+    logger.info("Metrics listen on %s:%d", host, int(port))
+    return server
+
+
+def stats_file_thread(filename, interval):
+    while True:
+        sleep(interval)
+        try:
+            with open(filename + '.tmp', 'w') as fp:
+                fp.write(metrics.render())
+            os.rename(filename + '.tmp', filename)
+        except (IOError, OSError) as e:
+            logger.error("Can't write stats file %s", str(e))
+
+
+def start_stats_file(filename, interval=10):
+    thread = Thread(target=stats_file_thread, args=(filename, interval), name='StatsFile')
+    thread.daemon = True
+    thread.start()
+    logger.info("Write stats to %s every %d sec", filename, interval)
+    return thread
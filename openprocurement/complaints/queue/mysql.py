@@ -1,15 +1,15 @@
 # -*- coding: utf-8 -*-
 import MySQLdb
+import MySQLdb.cursors
 import warnings
-import simplejson as json
-from openprocurement.complaints.queue.client import ComplaintsClient
+from openprocurement.complaints.queue.database import ComplaintsToDatabase
 from openprocurement.complaints.queue.utils import getboolean, retry
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-class ComplaintsToMySQL(ComplaintsClient):
+class ComplaintsToMySQL(ComplaintsToDatabase):
     """Complaints to MySQL bridge"""
 
     mysql_config = {
@@ -24,8 +24,19 @@ class ComplaintsToMySQL(ComplaintsClient):
         'drop_cache': False,
         'keep_alive': True,
         'max_packet': 500000,
+        'flush_size': 100,
+        'flush_interval': 5,
+        'compress': False,
+        'compress_min': 1024,
     }
 
+    # zlib data isn't valid utf8, send it as binary string w/o charset check
+    binary_columns = ['complaint_json']
+
+    db_error = MySQLdb.MySQLError
+    updated_at_sql = 'UNIX_TIMESTAMP(updated_at)'
+    clear_cache_sql = "TRUNCATE TABLE {table_name}_cache"
+
     def __init__(self, client_config=None, mysql_config=None):
         super(ComplaintsToMySQL, self).__init__(client_config)
         if mysql_config:
@@ -36,13 +47,15 @@ class ComplaintsToMySQL(ComplaintsClient):
         self.drop_cache = self.mysql_config.pop('drop_cache')
         self.keep_alive = self.mysql_config.pop('keep_alive')
         self.max_packet = int(self.mysql_config.pop('max_packet'))
+        self.flush_size = int(self.mysql_config.pop('flush_size') or 1)
+        self.flush_interval = float(self.mysql_config.pop('flush_interval') or 0)
+        self.compress = getboolean(self.mysql_config.pop('compress'))
+        self.compress_min = int(self.mysql_config.pop('compress_min') or 0)
         for k in ['init_command']:
             self.mysql_config[k] = self.mysql_config[k].strip(' \t"')
         for k in ['connect_timeout']:
             self.mysql_config[k] = int(self.mysql_config[k] or 0)
-        self.create_cursor()
-        self.create_tables()
-        self.restore_skip_until()
+        self.open_database()
 
     @retry(tries=10, delay=1, logger=logger)
     def create_cursor(self):
@@ -64,13 +77,6 @@ class ComplaintsToMySQL(ComplaintsClient):
             self.cursor = None
             self.create_cursor()
 
-    def execute_query(self, sql, *args):
-        return self.cursor.execute(sql.format(table_name=self.table_name), *args)
-
-    def query_and_fetchone(self, sql, *args):
-        self.execute_query(sql, *args)
-        return self.cursor.fetchone()
-
     def create_tables(self):
         SQL = """CREATE TABLE IF NOT EXISTS {table_name} (
                   tender_id char(32) NOT NULL,
@@ -87,6 +93,8 @@ class ComplaintsToMySQL(ComplaintsClient):
                   complaint_dateAccepted varchar(40) default NULL,
                   complaint_status varchar(40) NOT NULL,
                   complaint_json longblob NOT NULL,
+                  complaint_hash char(40) default NULL,
+                  complaint_format varchar(8) NOT NULL default 'json',
                   cancellation_json longblob default NULL,
                   cancellation_dateDecision varchar(40) default NULL,
                   PRIMARY KEY (complaint_id),
@@ -104,6 +112,8 @@ class ComplaintsToMySQL(ComplaintsClient):
             self.execute_query(SQL)
             self.dbcon.commit()
             self.drop_cache = True
+        self.upgrade_table('complaint_hash', "char(40) default NULL AFTER complaint_json")
+        self.upgrade_table('complaint_format', "varchar(8) NOT NULL default 'json' AFTER complaint_hash")
         # drop cache if we create main table
         if getboolean(self.drop_cache):
             try:
@@ -113,11 +123,28 @@ class ComplaintsToMySQL(ComplaintsClient):
                 self.dbcon.commit()
             except MySQLdb.MySQLError:
                 self.dbcon.rollback()
+            try:
+                self.query_and_fetchone("SELECT 1 FROM {table_name}_final LIMIT 1")
+                logger.warning("Drop final tenders table %s_final", self.table_name)
+                self.execute_query("DROP TABLE IF EXISTS {table_name}_final")
+                self.dbcon.commit()
+            except MySQLdb.MySQLError:
+                self.dbcon.rollback()
+            try:
+                self.query_and_fetchone("SELECT 1 FROM {table_name}_offset LIMIT 1")
+                logger.warning("Drop checkpoints table %s_offset", self.table_name)
+                self.execute_query("DROP TABLE IF EXISTS {table_name}_offset")
+                self.dbcon.commit()
+            except MySQLdb.MySQLError:
+                self.dbcon.rollback()
         # create tenders cache
         SQL = """CREATE TABLE IF NOT EXISTS {table_name}_cache (
                   tender_id char(32) NOT NULL,
                   tender_dateModified varchar(40) NOT NULL,
-                  PRIMARY KEY (tender_id)
+                  tender_status varchar(40) default NULL,
+                  updated_at datetime default NULL,
+                  PRIMARY KEY (tender_id),
+                  KEY updated_at (updated_at)
                 ) DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
             """
         try:
@@ -126,43 +153,149 @@ class ComplaintsToMySQL(ComplaintsClient):
             logger.warning("Create table '%s_cache'", self.table_name)
             self.execute_query(SQL)
             self.dbcon.commit()
-
-    def clear_cache(self):
-        if getattr(self, 'dbcon', None) is None:
-            return
-        logger.warning("Clear cache table '%s_cache'", self.table_name)
+        self.upgrade_table('tender_status', "varchar(40) default NULL", '_cache')
+        if self.upgrade_table('updated_at', "datetime default NULL, ADD KEY updated_at (updated_at)",
+                '_cache'):
+            # spread expiration of existing entries over cache_ttl
+            self.execute_query("UPDATE {table_name}_cache SET updated_at = " +
+                "NOW() - INTERVAL FLOOR(RAND() * %s) SECOND", (int(self.cache_ttl or 86400),))
+            self.dbcon.commit()
+        # create final tenders, which won't get new complaints
+        SQL = """CREATE TABLE IF NOT EXISTS {table_name}_final (
+                  tender_id char(32) NOT NULL,
+                  tender_dateModified varchar(40) NOT NULL,
+                  PRIMARY KEY (tender_id)
+                ) DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
+            """
         try:
-            self.execute_query("TRUNCATE TABLE {table_name}_cache")
+            self.query_and_fetchone("SELECT 1 FROM {table_name}_final LIMIT 1")
+        except MySQLdb.MySQLError:
+            logger.warning("Create table '%s_final'", self.table_name)
+            self.execute_query(SQL)
+            self.dbcon.commit()
+        # create processed tenders, kept like complaints, not dropped with cache
+        SQL = """CREATE TABLE IF NOT EXISTS {table_name}_processed (
+                  tender_id char(32) NOT NULL,
+                  tender_dateModified varchar(40) NOT NULL,
+                  PRIMARY KEY (tender_id)
+                ) DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
+            """
+        try:
+            self.query_and_fetchone("SELECT 1 FROM {table_name}_processed LIMIT 1")
+        except MySQLdb.MySQLError:
+            logger.warning("Create table '%s_processed'", self.table_name)
+            self.execute_query(SQL)
+            self.dbcon.commit()
+        # create feed checkpoints
+        SQL = """CREATE TABLE IF NOT EXISTS {table_name}_offset (
+                  worker_name varchar(80) NOT NULL,
+                  feed varchar(40) NOT NULL,
+                  feed_offset varchar(255) NOT NULL,
+                  last_dateModified varchar(40) default NULL,
+                  updated_at datetime NOT NULL,
+                  PRIMARY KEY (worker_name)
+                ) DEFAULT CHARSET=utf8 COLLATE=utf8_unicode_ci;
+            """
+        try:
+            self.query_and_fetchone("SELECT 1 FROM {table_name}_offset LIMIT 1")
+        except MySQLdb.MySQLError:
+            logger.warning("Create table '%s_offset'", self.table_name)
+            self.execute_query(SQL)
             self.dbcon.commit()
-        except MySQLdb.MySQLError as e:
-            logger.error("Can't clear cache %s", str(e))
-            self.dbcon.rollback()
 
-    def restore_skip_until(self):
-        if self.descending_mode:
-            return
-        row = self.query_and_fetchone("SELECT MAX(complaint_dateSubmitted) FROM {table_name}")
-        if not row or not row[0]:
-            return
-        row_date = row[0][:10]
-        if row_date < self.skip_until:
-            logger.info("Ignore offset from database '%s' use from config '%s'",
-                row_date, self.skip_until)
-            return
-        logger.info("Restore offset from database '%s'", row_date)
-        self.set_skip_until(row_date, minus_days=1)
-
-    def check_cache(self, tender):
-        row = self.query_and_fetchone(("SELECT tender_dateModified FROM {table_name}_cache " +
-            "WHERE tender_id=%s LIMIT 1"), (tender.id,))
-        return row and row[0] == tender.dateModified
-
-    def finish_tender(self, tender):
-        SQL = ("INSERT INTO {table_name}_cache (tender_id, tender_dateModified) " +
-               "VALUES (%s, %s) ON DUPLICATE KEY UPDATE tender_dateModified=%s")
-        # logger.debug(SQL)
-        self.execute_query(SQL, (tender.id, tender.dateModified, tender.dateModified))
+    def upgrade_table(self, column, definition, suffix=''):
+        """add column if not exists, return True if table was altered"""
+        row = self.query_and_fetchone("SHOW COLUMNS FROM {table_name}" + suffix +
+            " LIKE %s", (column,))
+        if row:
+            return False
+        logger.warning("Alter table '%s%s' add column %s", self.table_name, suffix, column)
+        self.execute_query("ALTER TABLE {table_name}" + suffix +
+            " ADD COLUMN %s %s" % (column, definition))
+        self.dbcon.commit()
+        return True
+
+    def stream_cursor(self):
+        # server side cursor streams rows w/o fetching whole table
+        return self.dbcon.cursor(MySQLdb.cursors.SSCursor)
+
+    def save_checkpoint(self, feed_offset, date_modified):
+        SQL = ("INSERT INTO {table_name}_offset (worker_name, feed, feed_offset, " +
+               "last_dateModified, updated_at) VALUES (%s, %s, %s, %s, NOW()) " +
+               "ON DUPLICATE KEY UPDATE feed=VALUES(feed), feed_offset=VALUES(feed_offset), " +
+               "last_dateModified=VALUES(last_dateModified), updated_at=VALUES(updated_at)")
+        feed = self.client_config['feed'] or 'changes'
+        self.execute_query(SQL, (self.worker_name, feed, str(feed_offset), date_modified))
+        self.dbcon.commit()
+
+    def expire_cache_list(self, limit):
+        statuses = ", ".join(["%s"] * len(self.final_statuses))
+        expired = list()
+        for ttl, status_cond in (
+                (self.cache_ttl, "(tender_status IS NULL OR tender_status NOT IN (%s))" % statuses),
+                (self.cache_ttl_final, "tender_status IN (%s)" % statuses)):
+            if len(expired) >= limit:
+                break
+            where = "updated_at < NOW() - INTERVAL %s SECOND AND " + status_cond
+            args = (int(ttl),) + tuple(self.final_statuses)
+            self.execute_query("SELECT tender_id FROM {table_name}_cache WHERE " + where +
+                " LIMIT %s", args + (limit - len(expired),))
+            tender_ids = [row[0] for row in self.cursor.fetchall()]
+            if not tender_ids:
+                continue
+            # check expiration again, entry could be updated by other worker
+            self.execute_query("DELETE FROM {table_name}_cache WHERE " + where +
+                " AND tender_id IN (%s)" % ", ".join(["%s"] * len(tender_ids)),
+                args + tuple(tender_ids))
+            expired.extend(tender_ids)
         self.dbcon.commit()
+        return expired
+
+    def write_buffers(self):
+        """write complaints, cache and processed rows in current transaction, w/o commit"""
+        if self.store_buffer:
+            insert_cols = ", ".join(self.store_columns)
+            insert_fmts = ", ".join(["_binary %s" if k in self.binary_columns else "%s"
+                for k in self.store_columns])
+            update_cols = ", ".join(["{0}=VALUES({0})".format(k) for k in self.update_columns])
+            SQL = "INSERT INTO {table_name} (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (
+                insert_cols, insert_fmts, update_cols)
+            # split multi-row insert to keep statements below max_packet
+            json_index = self.store_columns.index('complaint_json')
+            chunk, chunk_size = list(), 0
+            for row in self.store_buffer:
+                if chunk and chunk_size + len(row[json_index]) > self.max_packet:
+                    self.executemany_query(SQL, chunk)
+                    chunk, chunk_size = list(), 0
+                chunk.append(row)
+                chunk_size += len(row[json_index])
+            if chunk:
+                self.executemany_query(SQL, chunk)
+        if self.cache_buffer:
+            SQL = ("INSERT INTO {table_name}_cache (tender_id, tender_dateModified, " +
+                   "tender_status, updated_at) VALUES (%s, %s, %s, NOW()) ON DUPLICATE KEY " +
+                   "UPDATE tender_dateModified=VALUES(tender_dateModified), " +
+                   "tender_status=VALUES(tender_status), updated_at=VALUES(updated_at)")
+            self.executemany_query(SQL, self.cache_buffer)
+        if self.final_buffer:
+            SQL = ("INSERT INTO {table_name}_final (tender_id, tender_dateModified) " +
+                   "VALUES (%s, %s) ON DUPLICATE KEY UPDATE " +
+                   "tender_dateModified=VALUES(tender_dateModified)")
+            # last state of tender wins
+            final = dict(self.final_buffer)
+            rows = [row for row in final.items() if row[1]]
+            if rows:
+                self.executemany_query(SQL, rows)
+            deleted = [k for k, v in final.items() if not v]
+            if deleted:
+                self.execute_query("DELETE FROM {table_name}_final WHERE tender_id IN (%s)" %
+                    ", ".join(["%s"] * len(deleted)), deleted)
+        if self.processed_buffer:
+            SQL = ("INSERT INTO {table_name}_processed (tender_id, tender_dateModified) " +
+                   "VALUES (%s, %s) ON DUPLICATE KEY UPDATE " +
+                   "tender_dateModified=VALUES(tender_dateModified)")
+            # last state of tender wins
+            self.executemany_query(SQL, dict(self.processed_buffer).items())
 
     def ping_backend(self):
         if not getboolean(self.keep_alive):
@@ -172,65 +305,3 @@ class ComplaintsToMySQL(ComplaintsClient):
         except MySQLdb.MySQLError as e:
             logger.error("Error ping mysql %s", str(e))
             self.handle_error(e)
-
-    def check_exists(self, tender, complaint_path, complaint):
-        row = self.query_and_fetchone(("SELECT tender_status, tender_dateModified " +
-            "FROM {table_name} WHERE complaint_id=%s LIMIT 1"), (complaint.id,))
-        # don't update rows in terminal status
-        if row and row[0] == "cancelled":
-            logger.info("Ignore T=%s P=%s C=%s by TS=cancelled",
-                tender.id, complaint_path, complaint.id)
-            return True
-        if row and row[1] == tender.dateModified:
-            logger.info("Exists T=%s P=%s C=%s by DM=%s",
-                tender.id, complaint_path, complaint.id, tender.dateModified)
-            return True
-        return False
-
-    def store(self, complaint, complaint_path):
-        complaint_json = json.dumps(complaint)
-        if len(complaint_json) > 65000:
-            logger.warning("Too big T=%s P=%s C=%s size=%d", complaint.tender.id,
-                complaint_path, complaint.id, len(complaint_json))
-        if len(complaint_json) > self.max_packet:
-            max_title = int(self.max_packet / 125)
-            max_descr = int(self.max_packet / 6.25)
-            complaint.title = complaint.title[:max_title] + " (truncated)"
-            complaint.description = complaint.description[:max_descr] + " (truncated)"
-            complaint_json = json.dumps(complaint)
-            logger.warning("Complaint T=%s P=%s C=%s truncated to size=%d",
-                complaint.tender.id, complaint_path, complaint.id, len(complaint_json))
-        insert_data = [
-            ('tender_id', complaint.tender.id),
-            ('tender_status', complaint.tender.status),
-            ('tender_procurementMethod', complaint.tender.procurementMethod),
-            ('tender_procurementMethodType', complaint.tender.procurementMethodType),
-            ('tender_dateModified', complaint.tender.dateModified),
-            ('tender_mode', complaint.tender.get('mode', None)),
-            ('complaint_id', complaint.id),
-            ('complaint_complaintID', complaint.complaintID),
-            ('complaint_path', complaint_path),
-            ('complaint_acceptance', complaint.get('acceptance', None)),
-            ('complaint_dateSubmitted', complaint.get('dateSubmitted', None)),
-            ('complaint_dateAccepted',  complaint.get('dateAccepted', None)),
-            ('complaint_status', complaint.status),
-            ('complaint_json', complaint_json),
-        ]
-        update_data = [
-            ('tender_status', complaint.tender.status),
-            ('tender_dateModified', complaint.tender.dateModified),
-            ('complaint_status', complaint.status),
-            ('complaint_acceptance', complaint.get('acceptance', None)),
-            ('complaint_dateAccepted', complaint.get('dateAccepted', None)),
-            ('complaint_json', complaint_json),
-        ]
-        insert_cols = ", ".join([k for k,_ in insert_data])
-        insert_fmts = ", ".join(["%s" for _ in insert_data])
-        update_cols = ", ".join([k+"=%s" for k,_ in update_data])
-        values_args = [v for _,v in insert_data+update_data]
-
-        SQL = "INSERT INTO %s (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (
-            self.table_name, insert_cols, insert_fmts, update_cols)
-        #logger.debug(SQL)
-        self.execute_query(SQL, values_args)
-        self.dbcon.commit()
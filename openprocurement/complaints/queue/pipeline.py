@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from Queue import Queue, Full
+from threading import Thread, Event
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FeedReader(Thread):
+    """Prefetch feed pages to bounded queue while tenders are processed,
+    each item is (tenders_list, page_offset, error), empty tenders_list
+    or error means end of reading"""
+
+    def __init__(self, client, feed='changes', pages=2):
+        super(FeedReader, self).__init__(name='FeedReader')
+        self.daemon = True
+        self.client = client
+        self.feed = feed
+        self.queue = Queue(maxsize=max(int(pages), 1))
+        self.stopped = Event()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def get(self, timeout=1):
+        return self.queue.get(timeout=timeout)
+
+    def stop(self, idle=None):
+        """stop reading and wait for request in flight, it updates client offset"""
+        self.stopped.set()
+        while self.is_alive():
+            if idle:
+                idle()
+            self.join(1)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with metrics.timer('stage_seconds', stage='get_tenders'):
+                    tenders_list = self.client.get_tenders(feed=self.feed)
+                page_offset = self.client.params.get('offset')
+            except Exception as e:
+                self.put((None, None, e))
+                break
+            metrics.set('prefetched_pages', self.queue.qsize())
+            if not self.put((tenders_list, page_offset, None)) or not tenders_list:
+                break
+
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+import gc
+import cProfile
+import resource
+import threading
+from time import time, strftime
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """On-demand cProfile or memory profiling of the running worker,
+    requested from signal handler or metrics endpoint and started/stopped
+    by poll() from the main thread"""
+
+    def __init__(self):
+        self.worker_name = 'worker'
+        self.profile_dir = '/tmp'
+        self.default_seconds = 60
+        self.requested = None
+        self.mode = None
+        self.profile = None
+        self.deadline = 0
+
+    def request(self, seconds=None, mode='cpu'):
+        if mode not in ('cpu', 'memory'):
+            raise ValueError("Unknown profile mode '%s'" % mode)
+        self.requested = (mode, float(seconds or self.default_seconds))
+        logger.info("Profiling %s for %d sec requested", mode, self.requested[1])
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    def poll(self):
+        if not isinstance(threading.current_thread(), threading._MainThread):
+            return
+        if self.requested and not self.active:
+            mode, seconds = self.requested
+            self.requested = None
+            self.start(mode, seconds)
+        elif self.active and time() >= self.deadline:
+            self.stop()
+
+    def filename(self, ext):
+        return os.path.join(self.profile_dir, "complaints-%s-%d-%s.%s" % (
+            self.worker_name, os.getpid(), strftime("%Y%m%d-%H%M%S"), ext))
+
+    def start(self, mode, seconds):
+        logger.warning("Start %s profiling for %d sec", mode, seconds)
+        self.mode = mode
+        self.deadline = time() + seconds
+        if mode == 'cpu':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif tracemalloc:
+            tracemalloc.start()
+
+    def stop(self):
+        mode, self.mode = self.mode, None
+        try:
+            if mode == 'cpu':
+                self.profile.disable()
+                filename = self.filename('prof')
+                self.profile.dump_stats(filename)
+                self.profile = None
+            else:
+                filename = self.filename('mem')
+                self.dump_memory(filename)
+        except (IOError, OSError) as e:
+            logger.error("Can't save profile %s", str(e))
+            return
+        logger.warning("Stop %s profiling, saved to %s", mode, filename)
+
+    def dump_memory(self, filename, limit=50):
+        with open(filename, 'w') as fp:
+            fp.write("Peak RSS %d KB\n" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+            if tracemalloc:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                for stat in snapshot.statistics('lineno')[:limit]:
+                    fp.write("%s\n" % stat)
+                return
+            # w/o tracemalloc count live objects by type
+            counts = dict()
+            for obj in gc.get_objects():
+                name = type(obj).__name__
+                counts[name] = counts.get(name, 0) + 1
+            for name, count in sorted(counts.items(), key=lambda x: -x[1])[:limit]:
+                fp.write("%10d %s\n" % (count, name))
+
+
+profiler = Profiler()
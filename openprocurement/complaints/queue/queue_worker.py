@@ -7,12 +7,20 @@ import atexit
 import fcntl
 import time
 import signal
+import tempfile
 import logging
 import logging.config
+from datetime import date
 from threading import Thread
-from multiprocessing import Process
+from multiprocessing import Process, Queue
 from ConfigParser import ConfigParser, Error as ConfigParserError
-from openprocurement.complaints.queue.mysql import ComplaintsToMySQL
+from openprocurement.complaints.queue.metrics import metrics, register_command, \
+    start_metrics_server, start_stats_file
+from openprocurement.complaints.queue.backfill import split_windows, run_windows
+from openprocurement.complaints.queue.leases import LeaseTable
+from openprocurement.complaints.queue.profiler import profiler
+from openprocurement.complaints.queue.shards import run_reader, run_shard
+from openprocurement.complaints.queue.verify import verify_feed
 
 logger = logging.getLogger(__name__)
 
@@ -124,20 +132,77 @@ class MyConfigParser(ConfigParser):
         return value
 
 
-def run_app(config, descending=False):
+def create_app(config, client_config):
+    backend = config.get('general', 'backend') or 'mysql'
+    if backend == 'sqlite':
+        from openprocurement.complaints.queue.sqlite import ComplaintsToSQLite
+        return ComplaintsToSQLite(client_config, config.items('sqlite'))
+    if backend != 'mysql':
+        logger.warning("Unknown backend '%s' use mysql", backend)
+    from openprocurement.complaints.queue.mysql import ComplaintsToMySQL
+    return ComplaintsToMySQL(client_config, config.items('mysql'))
+
+
+def setup_metrics(config, worker_name, worker_index=0):
+    metrics.labels['worker'] = worker_name
+    port = config.get('general', 'metrics_port')
+    if port:
+        try:
+            start_metrics_server(int(port) + worker_index)
+        except Exception as e:
+            logger.error("Can't start metrics server %s", str(e))
+    stats_file = config.get('general', 'stats_file')
+    if stats_file:
+        start_stats_file("%s.%s" % (stats_file, worker_name),
+            int(config.get('general', 'stats_interval') or 10))
+
+
+def sigusr_handler(signo, frame):
+    profiler.request(mode='cpu' if signo == signal.SIGUSR1 else 'memory')
+    profiler.poll()
+
+
+def profile_command(seconds=None, mode='cpu'):
+    profiler.request(seconds, mode)
+    return "Profiling %s requested\n" % mode
+
+
+def setup_profiler(config, worker_name):
+    profiler.worker_name = worker_name
+    profiler.profile_dir = config.get('general', 'profile_dir') or tempfile.gettempdir()
+    profiler.default_seconds = int(config.get('general', 'profile_seconds') or 60)
+    signal.signal(signal.SIGUSR1, sigusr_handler)
+    signal.signal(signal.SIGUSR2, sigusr_handler)
+    register_command('/profile', profile_command)
+
+
+def run_app(config, descending=False, worker_name=None, worker_index=None,
+            target=None, client_options=(), leases=None):
     setup_watchdog(config.get('general', 'watchdog'))
+    if not worker_name:
+        worker_name = 'backward' if descending else 'forward'
+    if worker_index is None:
+        worker_index = 1 if descending else 0
+    setup_profiler(config, worker_name)
+    setup_metrics(config, worker_name, worker_index)
 
     client_config = config.items('client')
-    mysql_config = config.items('mysql')
+    client_config.append(('worker_name', worker_name))
+    client_config.extend(client_options)
 
     if descending:
         logger.info("Start in descending mode")
         client_config.append(('descending', 1))
 
-    app = ComplaintsToMySQL(client_config, mysql_config)
+    app = create_app(config, client_config)
     app.watchdog = Watchdog
+    app.leases = leases
+    register_command('/wakeup', lambda: app.wakeup() or "Wakeup requested\n")
     try:
-        app.run()
+        if target:
+            target(app)
+        else:
+            app.run()
     except (KeyboardInterrupt, SystemExit):
         sys.exit(2)
     except Exception as e:
@@ -149,11 +214,59 @@ def run_app(config, descending=False):
     return 0
 
 
-def run_child(config, descending, proc_pool):
+def run_child(config, descending, proc_pool, leases=None):
     # clear proc_pool to prevent self-kill
     proc_pool.clear()
     Watchdog.prntpid = os.getppid()
-    return run_app(config, descending)
+    return run_app(config, descending, leases=leases)
+
+
+def run_reader_child(config, shards, queues, acks, proc_pool):
+    proc_pool.clear()
+    Watchdog.prntpid = os.getppid()
+    timeout = int(config.get('general', 'shard_timeout') or 600)
+    return run_app(config, worker_name='forward', worker_index=0,
+        target=lambda app: run_reader(app, queues, acks, timeout))
+
+
+def run_shard_child(config, index, queues, acks, proc_pool):
+    proc_pool.clear()
+    Watchdog.prntpid = os.getppid()
+    # shards don't read feed, so don't rewind it
+    return run_app(config, worker_name='shard%d' % index, worker_index=index + 1,
+        target=lambda app: run_shard(app, index, queues[index], acks),
+        client_options=[('fast_rewind', 'no')])
+
+
+def run_backfill_child(config, index, windows, proc_pool):
+    proc_pool.clear()
+    Watchdog.prntpid = os.getppid()
+    # windows set own offsets, skip_until and checkpoints
+    return run_app(config, worker_name='backfill%d' % index, worker_index=index,
+        target=lambda app: run_windows(app, windows),
+        client_options=[('feed', 'dateModified'), ('fast_rewind', 'no')])
+
+
+def run_prepare_child(config):
+    Watchdog.prntpid = os.getppid()
+    # create tables and apply drop_cache, don't touch the feed
+    return run_app(config, worker_name='backfill', target=lambda app: None,
+        client_options=[('fast_rewind', 'no'), ('cache_preload', 'no'), ('final_cache', 'no')])
+
+
+def prepare_backfill(config):
+    """create tables and apply drop_cache once before backfill children
+    start, they share offset and cache tables and must not drop them
+    on (re)start, neither should workers started after backfill"""
+    backend = config.get('general', 'backend') or 'mysql'
+    logger.info("Prepare %s tables for backfill", backend)
+    process = Process(target=run_prepare_child, args=(config,), name='Worker.Prepare')
+    process.start()
+    process.join()
+    if process.exitcode:
+        raise SystemExit("Backfill prepare failed with error %d" % process.exitcode)
+    if config.has_section(backend):
+        config.set(backend, 'drop_cache', 'no')
 
 
 def stop_workers(pool, mypid):
@@ -168,23 +281,20 @@ def stop_workers(pool, mypid):
     pool = {}
 
 
-def run_workers(config):
-    workers = int(config.get('general', 'workers') or 0)
-
-    if not workers:
-        logger.info("Starting in signle process")
-        return run_app(config)
-
-    logger.info("Starting watcher with %d workers", workers)
-
-    pool = {}
+def watch_workers(pool, restart_finished=True):
+    """start children of pool and restart exited ones, children exited
+    w/o error are removed from pool unless restart_finished"""
 
-    if workers > 0:
-        pool['fwd'] = dict(target=run_child, args=(config, 0, pool), name='Worker.Forward')
-    if workers > 1:
-        pool['bwd'] = dict(target=run_child, args=(config, 1, pool), name='Worker.Backward')
+    # forward profiling signals to child workers
+    def forward_signal(signo, frame):
+        for p in pool.values():
+            process = p.get('process', None)
+            if process and process.is_alive():
+                logger.info("Send signal %d to %s %d", signo, process.name, process.pid)
+                os.kill(process.pid, signo)
 
-    atexit.register(stop_workers, pool, os.getpid())
+    signal.signal(signal.SIGUSR1, forward_signal)
+    signal.signal(signal.SIGUSR2, forward_signal)
 
     while pool:
         for k, p in pool.items():
@@ -203,28 +313,120 @@ def run_workers(config):
                 time.sleep(0.5)
             if process.is_alive():
                 process.join(1)
+            elif process.exitcode == 0 and not restart_finished:
+                logger.info("Child %s finished", process.name)
+                pool.pop(k)
             else:
                 logger.warning("Child %s exited with error %d",
                     process.name, process.exitcode)
                 p.pop('process')
             time.sleep(0.5)
 
+
+def run_workers(config):
+    workers = int(config.get('general', 'workers') or 0)
+    shards = int(config.get('general', 'shards') or 0)
+
+    if not workers and not shards:
+        logger.info("Starting in signle process")
+        return run_app(config)
+
+    pool = {}
+
+    if shards > 0:
+        logger.info("Starting watcher with reader and %d shards", shards)
+        # queues are created by watcher and survive restart of children
+        queues = [Queue() for i in range(shards)]
+        acks = Queue()
+        pool['reader'] = dict(target=run_reader_child,
+            args=(config, shards, queues, acks, pool), name='Worker.Reader')
+        for i in range(shards):
+            pool['shard%d' % i] = dict(target=run_shard_child,
+                args=(config, i, queues, acks, pool), name='Worker.Shard%d' % i)
+    else:
+        logger.info("Starting watcher with %d workers", workers)
+
+    leases = None
+    if not shards and workers > 1 and config.getboolean('general', 'leases', True):
+        # shared by forward and backward workers, survives restart of children
+        leases = LeaseTable(int(config.get('general', 'lease_size') or 4096),
+            int(config.get('general', 'lease_ttl') or 120))
+
+    if not shards and workers > 0:
+        pool['fwd'] = dict(target=run_child, args=(config, 0, pool, leases),
+            name='Worker.Forward')
+    if not shards and workers > 1:
+        pool['bwd'] = dict(target=run_child, args=(config, 1, pool, leases),
+            name='Worker.Backward')
+
+    atexit.register(stop_workers, pool, os.getpid())
+
+    watch_workers(pool)
+
     logger.info("Leave watcher")
     return 0
 
 
+def run_backfill(config, date_from, date_to):
+    """process [date_from, date_to) in dateModified windows by parallel
+    children, restart failed ones from window checkpoint, return when
+    all windows are finished"""
+    workers = int(config.get('general', 'backfill_workers') or 4)
+    days = int(config.get('general', 'backfill_window') or 7)
+    windows = split_windows(date_from, date_to, days)
+    workers = min(workers, len(windows))
+    logger.info("Starting backfill %s - %s, %d windows in %d workers",
+        date_from, date_to, len(windows), workers)
+
+    prepare_backfill(config)
+
+    pool = {}
+    for i in range(workers):
+        pool['backfill%d' % i] = dict(target=run_backfill_child,
+            args=(config, i, windows[i::workers], pool), name='Worker.Backfill%d' % i)
+
+    atexit.register(stop_workers, pool, os.getpid())
+
+    watch_workers(pool, restart_finished=False)
+
+    logger.info("Backfill finished, continue from %s", date_to)
+    return 0
+
+
+def run_verify(config, date_from=None):
+    """compare database with feed in single process beside running workers,
+    concurrency and rate are limited by verify_workers and verify_rate"""
+    refetch = config.getboolean('general', 'verify_refetch', True)
+    client_options = [('feed', 'dateModified'), ('fast_rewind', 'no'),
+        ('cache_preload', 'no'), ('final_cache', 'no'),
+        ('fetch_workers', int(config.get('general', 'verify_workers') or 2)),
+        ('rate_max', config.get('general', 'verify_rate') or 10)]
+
+    def target(app):
+        for line in verify_feed(app, date_from, refetch):
+            logger.info("%s", line)
+
+    return run_app(config, worker_name='verify', worker_index=2, target=target,
+        client_options=client_options)
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('config', nargs=1, help='config.ini file')
     parser.add_argument('-d', '--daemon', action='store_true', help='run as daemon in background')
     parser.add_argument('-w', '--workers', help='start as watcher and fork child workers (max 2)')
+    parser.add_argument('-s', '--shards', help='start feed reader and N hash-sharded workers')
     parser.add_argument('-p', '--pidfile', help='store pid in file, remove file on exit')
     parser.add_argument('-l', '--logfile', help='redirect stdout and stderr to logfile')
+    parser.add_argument('-b', '--backfill', nargs='+', metavar='DATE',
+        help='process FROM [TO] in parallel dateModified windows, then continue as usual')
+    parser.add_argument('--verify', nargs='?', const='', metavar='FROM',
+        help='compare database with feed from FROM or skip_until, refetch missing and stale')
     return parser.parse_args()
 
 
 def update_config(config, args):
-    for opt in ['daemon', 'workers', 'pidfile', 'logfile']:
+    for opt in ['daemon', 'workers', 'shards', 'pidfile', 'logfile']:
         if getattr(args, opt, None):
             config.set('general', opt, str(getattr(args, opt)))
 
@@ -241,12 +443,23 @@ def main():
 
     signal.signal(signal.SIGTERM, sigterm_handler)
 
+    # verify runs beside workers, so don't daemonize and lock pidfile
+    if args.verify is not None:
+        return run_verify(config, args.verify)
+
     if config.getboolean('general', 'daemon'):
         daemonize(config.get('general', 'logfile'))
 
     write_pidfile(config.get('general', 'pidfile'))
 
     try:
+        if args.backfill:
+            date_from = args.backfill[0]
+            date_to = args.backfill[1] if len(args.backfill) > 1 else \
+                date.today().strftime("%Y-%m-%d")
+            run_backfill(config, date_from, date_to)
+            # forward worker picks up where backfill ended
+            config.set('client', 'skip_until', date_to)
         run_workers(config)
     except (KeyboardInterrupt, SystemExit):
         sys.exit(2)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+import errno
+import fcntl
+import select
+
+
+class Wakeup(object):
+    """Event based on pipe, wait() blocks in select w/o polling
+    and is interrupted by set() from other thread or signal handler"""
+
+    def __init__(self):
+        self.rfd, self.wfd = os.pipe()
+        for fd in (self.rfd, self.wfd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def set(self):
+        try:
+            os.write(self.wfd, 'w')
+        except OSError:
+            pass
+
+    def clear(self):
+        try:
+            while os.read(self.rfd, 1024):
+                pass
+        except OSError:
+            pass
+
+    def wait(self, timeout):
+        """return True if woken up"""
+        try:
+            ready, _, _ = select.select([self.rfd], [], [], max(timeout, 0))
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return False
+        if ready:
+            self.clear()
+            return True
+        return False
+
+
+class PollScheduler(object):
+    """Adaptive interval between feed polls: reset to minimum when pages
+    were full, shorten when feed had new items, back off when it was idle"""
+
+    def __init__(self, interval=10, min_interval=1, max_interval=300, backoff=2.0):
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.backoff = max(float(backoff), 1.0)
+        self.interval = min(max(float(interval), self.min_interval), self.max_interval)
+
+    def next_interval(self, items, full_pages):
+        if full_pages:
+            self.interval = self.min_interval
+        elif items:
+            self.interval = max(self.interval / self.backoff, self.min_interval)
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+from time import time
+from Queue import Empty
+from openprocurement.complaints.queue.feed import FeedItem
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def shard_index(tender_id, shards):
+    """stable shard number of tender, same in all processes"""
+    return (zlib.crc32(tender_id) & 0xffffffff) % shards
+
+
+class ShardDispatcher(object):
+    """Replaces process_tenders of the feed reader, hands out tenders
+    to shard queues and waits until all shards finished the page,
+    tenders not acked as done by shard are failed"""
+
+    def __init__(self, app, queues, acks, timeout=600):
+        self.app = app
+        self.queues = queues
+        self.acks = acks
+        self.timeout = timeout
+        self.page_counter = 0
+
+    def __call__(self, tenders, sleep_time=1):
+        self.page_counter += 1
+        page_id = "%d-%d" % (os.getpid(), self.page_counter)
+        expected = [set() for queue in self.queues]
+        for tender in tenders:
+            index = shard_index(tender.id, len(self.queues))
+            expected[index].add(tender.id)
+            self.queues[index].put((page_id, tender.id, tender.dateModified))
+        for queue in self.queues:
+            queue.put((page_id, None, None))
+        failed = self.wait_acks(page_id, expected)
+        # shards update cache table, keep reader in-memory cache in sync
+        for tender in tenders:
+            if tender.id not in failed:
+                self.app.tender_cache.set(tender.id, tender.dateModified,
+                    self.app.cache_expires())
+        metrics.inc('shard_pages_total')
+        return failed
+
+    def wait_acks(self, page_id, expected):
+        waiting = set(range(len(self.queues)))
+        failed = set()
+        deadline = time() + self.timeout
+        while waiting:
+            if self.app.should_stop:
+                raise SystemExit("Stop while waiting shards")
+            if time() > deadline:
+                # restart from last checkpoint, page will be processed again
+                raise SystemExit("Timeout waiting shards %s" % sorted(waiting))
+            self.app.reset_watchdog()
+            try:
+                ack_page_id, index, done = self.acks.get(timeout=1)
+            except Empty:
+                continue
+            if ack_page_id != page_id:
+                logger.debug("Ignore ack %s from shard %d", ack_page_id, index)
+                continue
+            waiting.discard(index)
+            # shard restarted in the middle of page lost part of it
+            lost = expected[index].difference(done)
+            if lost:
+                logger.warning("Shard %d didn't process %d tenders of page %s",
+                    index, len(lost), page_id)
+            failed.update(lost)
+        return failed
+
+
+def run_reader(app, queues, acks, timeout=600):
+    logger.info("Start feed reader for %d shards", len(queues))
+    app.process_tenders = ShardDispatcher(app, queues, acks, timeout)
+    app.run()
+
+
+def run_shard(app, index, queue, acks):
+    logger.info("Start shard %d", index)
+    tenders = list()
+    while not app.should_stop:
+        app.reset_watchdog()
+        try:
+            page_id, tender_id, date_modified = queue.get(timeout=1)
+        except Empty:
+            if app.need_reset_client():
+                app.reset_client(True)
+            continue
+        if tender_id:
+            tenders.append(FeedItem(tender_id, date_modified))
+            continue
+        app.ping_backend()
+        failed = app.process_tenders(tenders)
+        if not app.commit_page(None, None):
+            failed = [t.id for t in tenders]
+        app.tenders_count += len(tenders)
+        failed = set(failed)
+        acks.put((page_id, index, [t.id for t in tenders if t.id not in failed]))
+        if tenders:
+            app.log_progress(tenders[-1].dateModified)
+        tenders = list()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from time import time
+from openprocurement.complaints.queue.database import ComplaintsToDatabase
+from openprocurement.complaints.queue.utils import getboolean
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ComplaintsToSQLite(ComplaintsToDatabase):
+    """Complaints to SQLite bridge"""
+
+    sqlite_config = {
+        'database': 'complaints.db',
+        'table': 'complaints',
+        'timeout': 60,
+        'drop_cache': False,
+        'synchronous': 'NORMAL',
+        'flush_size': 1000,
+        'flush_interval': 5,
+        'compress': False,
+        'compress_min': 1024,
+    }
+
+    placeholder = '?'
+    db_error = sqlite3.Error
+    # SQLite limits number of host parameters to 999
+    cache_chunk_size = 500
+
+    def __init__(self, client_config=None, sqlite_config=None):
+        super(ComplaintsToSQLite, self).__init__(client_config)
+        if sqlite_config:
+            self.sqlite_config.update(sqlite_config)
+        self.database = self.sqlite_config['database']
+        self.table_name = self.sqlite_config['table']
+        self.drop_cache = self.sqlite_config['drop_cache']
+        self.flush_size = int(self.sqlite_config['flush_size'] or 1)
+        self.flush_interval = float(self.sqlite_config['flush_interval'] or 0)
+        self.compress = getboolean(self.sqlite_config['compress'])
+        self.compress_min = int(self.sqlite_config['compress_min'] or 0)
+        self.open_database()
+
+    def create_cursor(self):
+        logger.info("Open sqlite database '%s' table '%s'", self.database, self.table_name)
+        if getattr(self, 'dbcon', None):
+            dbcon, self.dbcon = self.dbcon, None
+            dbcon.close()
+        self.dbcon = sqlite3.connect(self.database,
+            timeout=float(self.sqlite_config['timeout'] or 60))
+        self.dbcon.text_factory = str
+        self.cursor = self.dbcon.cursor()
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=%s" % self.sqlite_config['synchronous'])
+
+    def handle_error(self, error):
+        super(ComplaintsToSQLite, self).handle_error(error)
+        if isinstance(error, sqlite3.Error):
+            self.dbcon.rollback()
+
+    def table_exists(self, table_name):
+        return self.query_and_fetchone("SELECT 1 FROM sqlite_master " +
+            "WHERE type='table' AND name=?", (table_name,)) is not None
+
+    def create_tables(self):
+        if not self.table_exists(self.table_name):
+            logger.warning("Create table '%s'", self.table_name)
+            self.cursor.executescript("""
+                CREATE TABLE {table_name} (
+                  tender_id char(32) NOT NULL,
+                  tender_status varchar(40) NOT NULL,
+                  tender_procurementMethod varchar(40) NOT NULL,
+                  tender_procurementMethodType varchar(40) NOT NULL,
+                  tender_dateModified varchar(40) NOT NULL,
+                  tender_mode varchar(40) default NULL,
+                  complaint_id char(32) NOT NULL PRIMARY KEY,
+                  complaint_complaintID varchar(40) NOT NULL,
+                  complaint_path varchar(80) NOT NULL,
+                  complaint_acceptance tinyint(1) default NULL,
+                  complaint_dateSubmitted varchar(40) default NULL,
+                  complaint_dateAccepted varchar(40) default NULL,
+                  complaint_status varchar(40) NOT NULL,
+                  complaint_json blob NOT NULL,
+                  complaint_hash char(40) default NULL,
+                  complaint_format varchar(8) NOT NULL default 'json',
+                  cancellation_json blob default NULL,
+                  cancellation_dateDecision varchar(40) default NULL
+                );
+                CREATE INDEX {table_name}_complaintID ON {table_name} (complaint_complaintID);
+                CREATE INDEX {table_name}_dateSubmitted ON {table_name} (complaint_dateSubmitted);
+                CREATE INDEX {table_name}_status ON {table_name} (complaint_status);
+                CREATE INDEX {table_name}_procurementMethod ON {table_name} (tender_procurementMethod);
+            """.format(table_name=self.table_name))
+            self.dbcon.commit()
+            self.drop_cache = True
+        # drop cache if we create main table
+        if getboolean(self.drop_cache):
+            logger.warning("Drop cache tables %s_cache %s_final %s_offset", self.table_name,
+                self.table_name, self.table_name)
+            self.execute_query("DROP TABLE IF EXISTS {table_name}_cache")
+            self.execute_query("DROP TABLE IF EXISTS {table_name}_final")
+            self.execute_query("DROP TABLE IF EXISTS {table_name}_offset")
+            self.dbcon.commit()
+        self.execute_query("""CREATE TABLE IF NOT EXISTS {table_name}_cache (
+                  tender_id char(32) NOT NULL PRIMARY KEY,
+                  tender_dateModified varchar(40) NOT NULL,
+                  tender_status varchar(40) default NULL,
+                  updated_at integer default NULL
+                )""")
+        self.upgrade_table('tender_status', "varchar(40) default NULL", '_cache')
+        if self.upgrade_table('updated_at', "integer default NULL", '_cache'):
+            # spread expiration of existing entries over cache_ttl
+            self.execute_query("UPDATE {table_name}_cache SET updated_at = " +
+                "? - abs(random()) % ?", (int(time()), int(self.cache_ttl or 86400)))
+        self.execute_query("CREATE INDEX IF NOT EXISTS {table_name}_cache_updated_at " +
+            "ON {table_name}_cache (updated_at)")
+        self.execute_query("""CREATE TABLE IF NOT EXISTS {table_name}_final (
+                  tender_id char(32) NOT NULL PRIMARY KEY,
+                  tender_dateModified varchar(40) NOT NULL
+                )""")
+        # processed tenders are kept like complaints, not dropped with cache
+        self.execute_query("""CREATE TABLE IF NOT EXISTS {table_name}_processed (
+                  tender_id char(32) NOT NULL PRIMARY KEY,
+                  tender_dateModified varchar(40) NOT NULL
+                )""")
+        self.execute_query("""CREATE TABLE IF NOT EXISTS {table_name}_offset (
+                  worker_name varchar(80) NOT NULL PRIMARY KEY,
+                  feed varchar(40) NOT NULL,
+                  feed_offset varchar(255) NOT NULL,
+                  last_dateModified varchar(40) default NULL,
+                  updated_at datetime NOT NULL
+                )""")
+        self.dbcon.commit()
+
+    def upgrade_table(self, column, definition, suffix=''):
+        """add column if not exists, return True if table was altered"""
+        self.execute_query("PRAGMA table_info({table_name}" + suffix + ")")
+        if column in [row[1] for row in self.cursor.fetchall()]:
+            return False
+        logger.warning("Alter table '%s%s' add column %s", self.table_name, suffix, column)
+        self.execute_query("ALTER TABLE {table_name}" + suffix +
+            " ADD COLUMN %s %s" % (column, definition))
+        self.dbcon.commit()
+        return True
+
+    def save_checkpoint(self, feed_offset, date_modified):
+        SQL = ("INSERT OR REPLACE INTO {table_name}_offset (worker_name, feed, feed_offset, " +
+               "last_dateModified, updated_at) VALUES (?, ?, ?, ?, datetime('now'))")
+        feed = self.client_config['feed'] or 'changes'
+        self.execute_query(SQL, (self.worker_name, feed, str(feed_offset), date_modified))
+        self.dbcon.commit()
+
+    def expire_cache_list(self, limit):
+        statuses = ", ".join(["?"] * len(self.final_statuses))
+        expired = list()
+        now = int(time())
+        for ttl, status_cond in (
+                (self.cache_ttl, "(tender_status IS NULL OR tender_status NOT IN (%s))" % statuses),
+                (self.cache_ttl_final, "tender_status IN (%s)" % statuses)):
+            if len(expired) >= limit:
+                break
+            where = "updated_at < ? AND " + status_cond
+            args = (now - int(ttl),) + tuple(self.final_statuses)
+            self.execute_query("SELECT tender_id FROM {table_name}_cache WHERE " + where +
+                " LIMIT ?", args + (limit - len(expired),))
+            tender_ids = [row[0] for row in self.cursor.fetchall()]
+            if not tender_ids:
+                continue
+            self.execute_query("DELETE FROM {table_name}_cache WHERE " + where +
+                " AND tender_id IN (%s)" % ", ".join(["?"] * len(tender_ids)),
+                args + tuple(tender_ids))
+            expired.extend(tender_ids)
+        self.dbcon.commit()
+        return expired
+
+    def write_buffers(self):
+        """write complaints, cache and processed rows in current transaction, w/o commit"""
+        if self.store_buffer:
+            # keep columns not managed here (cancellation_json) on update
+            SQL = "INSERT OR IGNORE INTO {table_name} (%s) VALUES (%s)" % (
+                ", ".join(self.store_columns), ", ".join(["?"] * len(self.store_columns)))
+            self.executemany_query(SQL, self.store_buffer)
+            index = [self.store_columns.index(k) for k in self.update_columns]
+            id_index = self.store_columns.index('complaint_id')
+            SQL = "UPDATE {table_name} SET %s WHERE complaint_id=?" % (
+                ", ".join([k + "=?" for k in self.update_columns]))
+            self.executemany_query(SQL, [[row[i] for i in index] + [row[id_index]]
+                for row in self.store_buffer])
+        if self.cache_buffer:
+            SQL = ("INSERT OR REPLACE INTO {table_name}_cache (tender_id, tender_dateModified, " +
+                   "tender_status, updated_at) VALUES (?, ?, ?, ?)")
+            now = int(time())
+            self.executemany_query(SQL, [row + (now,) for row in self.cache_buffer])
+        if self.final_buffer:
+            SQL = ("INSERT OR REPLACE INTO {table_name}_final (tender_id, tender_dateModified) " +
+                   "VALUES (?, ?)")
+            # last state of tender wins
+            final = dict(self.final_buffer)
+            rows = [row for row in final.items() if row[1]]
+            if rows:
+                self.executemany_query(SQL, rows)
+            deleted = [(k,) for k, v in final.items() if not v]
+            if deleted:
+                self.executemany_query("DELETE FROM {table_name}_final WHERE tender_id=?", deleted)
+        if self.processed_buffer:
+            SQL = ("INSERT OR REPLACE INTO {table_name}_processed (tender_id, " +
+                   "tender_dateModified) VALUES (?, ?)")
+            self.executemany_query(SQL, dict(self.processed_buffer).items())
+
+    def encode_complaint(self, complaint):
+        complaint_json, complaint_format = super(ComplaintsToSQLite, self).encode_complaint(complaint)
+        if self.compress:
+            return sqlite3.Binary(complaint_json), complaint_format
+        return complaint_json, complaint_format
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import time
+from openprocurement.complaints.queue.cache import TenderCache, FinalTenders
+from openprocurement.complaints.queue.verify import ProcessedTenders, OK, MISSING, STALE
+from openprocurement.complaints.queue.feed import FeedItem
+
+
+def tender_id(n):
+    return "%016x%016x" % (n * 7919 + 1, n)
+
+
+class TenderCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = TenderCache(10)
+        cache.set('a', '2016-09-01')
+        self.assertEqual(cache.get('a'), '2016-09-01')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = TenderCache(3)
+        cache.update([('a', '1'), ('b', '2'), ('c', '3')])
+        # a becomes recently used, b is the oldest one
+        cache.get('a')
+        cache.set('d', '4')
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn('b', cache)
+        self.assertEqual([cache.get(k) for k in 'acd'], ['1', '3', '4'])
+
+    def test_set_replaces_and_refreshes(self):
+        cache = TenderCache(2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.set('a', '3')
+        cache.set('c', '4')
+        self.assertEqual(cache.get('a'), '3')
+        self.assertNotIn('b', cache)
+
+    def test_expired_is_miss(self):
+        cache = TenderCache(10)
+        cache.set('a', '1', time() - 1)
+        cache.set('b', '2', time() + 60)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), '2')
+        self.assertEqual(cache.misses, 1)
+
+    def test_zero_size(self):
+        cache = TenderCache(0)
+        cache.set('a', '1')
+        self.assertEqual(len(cache), 0)
+
+    def test_discard_clear(self):
+        cache = TenderCache(10)
+        cache.update([('a', '1', None), ('b', '2', None)])
+        cache.discard('a')
+        cache.discard('x')
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class FinalTendersTest(unittest.TestCase):
+
+    def test_add_check(self):
+        final = FinalTenders(merge_size=100)
+        final.add(tender_id(1), '2016-09-01')
+        self.assertIn(tender_id(1), final)
+        self.assertTrue(final.check(tender_id(1), '2016-09-01'))
+        self.assertFalse(final.check(tender_id(1), '2016-09-02'))
+        self.assertFalse(final.check(tender_id(2), '2016-09-01'))
+
+    def test_merge_keeps_sorted(self):
+        final = FinalTenders(merge_size=10)
+        for n in range(95):
+            final.add(tender_id(n), '2016-09-01')
+        final.merge()
+        self.assertEqual(len(final), 95)
+        self.assertEqual(list(final.keys), sorted(final.keys))
+        for n in range(95):
+            self.assertTrue(final.check(tender_id(n), '2016-09-01'))
+
+    def test_pending_replaces_merged(self):
+        final = FinalTenders(merge_size=100)
+        final.add(tender_id(1), '2016-09-01')
+        final.merge()
+        final.add(tender_id(1), '2016-09-02')
+        self.assertTrue(final.check(tender_id(1), '2016-09-02'))
+        final.merge()
+        self.assertEqual(len(final.keys), 1)
+        self.assertTrue(final.check(tender_id(1), '2016-09-02'))
+
+    def test_discard(self):
+        final = FinalTenders(merge_size=100)
+        for n in range(3):
+            final.add(tender_id(n), '2016-09-01')
+        final.merge()
+        final.add(tender_id(3), '2016-09-01')
+        # one merged and one pending entry
+        final.discard(tender_id(0))
+        final.discard(tender_id(3))
+        final.discard(tender_id(9))
+        self.assertNotIn(tender_id(0), final)
+        self.assertNotIn(tender_id(3), final)
+        final.merge()
+        self.assertEqual(len(final), 2)
+        self.assertEqual(list(final.values), [final.value('2016-09-01')] * 2)
+
+    def test_compaction_keeps_value_type(self):
+        final = FinalTenders(merge_size=100)
+        for n in range(5):
+            final.add(tender_id(n), '2016-09-01')
+        final.merge()
+        final.discard(tender_id(2))
+        final.merge()
+        self.assertEqual(final.values.typecode, FinalTenders.value_type)
+        self.assertEqual(len(final.keys), len(final.values))
+
+    def test_opaque_id(self):
+        final = FinalTenders()
+        final.add('not-a-hex-id', '2016-09-01')
+        self.assertTrue(final.check('not-a-hex-id', '2016-09-01'))
+
+    def test_clear(self):
+        final = FinalTenders()
+        final.add(tender_id(1), '2016-09-01')
+        final.clear()
+        self.assertEqual(len(final), 0)
+
+
+class ProcessedTendersTest(unittest.TestCase):
+
+    def test_newest_wins(self):
+        index = ProcessedTenders(merge_size=100)
+        index.add(tender_id(1), '2016-09-02T10:00:00+03:00')
+        index.add(tender_id(1), '2016-09-01T10:00:00+03:00')
+        index.merge()
+        self.assertEqual(index.lookup(index.key(tender_id(1))),
+            index.value('2016-09-02T10:00:00+03:00'))
+
+    def test_compare(self):
+        index = ProcessedTenders(merge_size=100)
+        index.add(tender_id(1), '2016-09-01T10:00:00+03:00')
+        index.add(tender_id(2), '2016-09-01T10:00:00+03:00')
+        index.merge()
+        result = index.compare([
+            FeedItem(tender_id(1), '2016-09-01T10:00:00+03:00'),
+            FeedItem(tender_id(2), '2016-09-01T10:00:00.5+03:00'),
+            FeedItem(tender_id(3), '2016-09-01T10:00:00+03:00'),
+        ])
+        self.assertEqual([state for _, state in result], [OK, STALE, MISSING])
+
+    def test_compaction_keeps_timestamps(self):
+        index = ProcessedTenders(merge_size=100)
+        for n in range(3):
+            index.add(tender_id(n), '2016-09-01T10:00:00.25+03:00')
+        index.merge()
+        index.discard(tender_id(0))
+        index.merge()
+        self.assertEqual(index.values.typecode, 'd')
+        self.assertEqual(index.lookup(index.key(tender_id(1))),
+            index.value('2016-09-01T10:00:00.25+03:00'))
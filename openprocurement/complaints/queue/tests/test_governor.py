@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import unittest
+from openprocurement.complaints.queue.governor import Governor, CircuitOpenError
+
+
+class Response(Exception):
+    def __init__(self, status_int=None):
+        self.status_int = status_int
+
+
+class GovernorTest(unittest.TestCase):
+
+    def governor(self, **kwargs):
+        options = dict(max_concurrency=8, rate_max=0, rate_min=0.5,
+            circuit_errors=3, circuit_timeout=10, circuit_max=40)
+        options.update(kwargs)
+        return Governor(**options)
+
+    def test_additive_increase(self):
+        gov = self.governor(rate_max=20)
+        gov.limit, gov.rate = 2, 5.0
+        for i in range(2):
+            gov.on_success(100, 'ok')
+        self.assertEqual((gov.limit, gov.rate), (3, 6.0))
+        gov.rate = 19.5
+        for i in range(3):
+            gov.on_success(100, 'ok')
+        self.assertEqual((gov.limit, gov.rate), (4, 20.0))
+
+    def test_limit_capped(self):
+        gov = self.governor(max_concurrency=2)
+        for i in range(10):
+            gov.on_success(100, 'ok')
+        self.assertEqual(gov.limit, 2)
+
+    def test_multiplicative_decrease(self):
+        gov = self.governor(rate_max=16)
+        gov.decrease(100, 'test')
+        self.assertEqual(gov.limit, 4)
+        self.assertTrue(0.5 <= gov.rate <= 8)
+
+    def test_decrease_once_per_round_trip(self):
+        gov = self.governor()
+        gov.decrease(100, 'test')
+        gov.decrease(100.5, 'test')
+        self.assertEqual(gov.limit, 4)
+        gov.decrease(102, 'test')
+        self.assertEqual(gov.limit, 2)
+
+    def test_rate_min(self):
+        gov = self.governor(rate_max=1, rate_min=0.5)
+        for now in range(100, 110, 2):
+            gov.decrease(now, 'test')
+        self.assertEqual((gov.limit, gov.rate), (1, 0.5))
+
+    def test_slow_response_decreases(self):
+        gov = self.governor()
+        gov.on_success(100, 'slow')
+        self.assertEqual(gov.limit, 4)
+
+    def test_circuit_opens(self):
+        gov = self.governor()
+        for i in range(3):
+            gov.on_failure(100 + 2 * i, 'error')
+        self.assertEqual(gov.state, Governor.OPEN)
+        self.assertEqual(gov.limit, 1)
+        self.assertTrue(gov.overloaded)
+        self.assertEqual(gov.wait_slot(106), 8)
+
+    def test_half_open_probe(self):
+        gov = self.governor()
+        gov.open_circuit(100, 'test')
+        self.assertEqual(gov.wait_slot(111), 0)
+        self.assertEqual(gov.state, Governor.HALF_OPEN)
+        gov.probing = True
+        # only one probe request at time
+        self.assertTrue(gov.wait_slot(111) > 0)
+        gov.on_success(112, 'ok')
+        self.assertEqual(gov.state, Governor.CLOSED)
+        self.assertEqual(gov.failures, 0)
+
+    def test_failed_probe_backoff(self):
+        gov = self.governor()
+        gov.open_circuit(100, 'test')
+        for i in range(3):
+            gov.wait_slot(gov.open_until + 1)
+            gov.on_failure(gov.open_until + 1, 'error')
+        self.assertEqual(gov.state, Governor.OPEN)
+        self.assertEqual(gov.open_timeout, 40)
+
+    def test_throttled_overloaded(self):
+        gov = self.governor()
+        gov.on_failure(100, 'throttled')
+        self.assertEqual(gov.state, Governor.CLOSED)
+        self.assertEqual(gov.last_throttle, 100)
+
+    def test_classify(self):
+        gov = self.governor()
+        self.assertEqual(gov.classify(Response(429)), 'throttled')
+        self.assertEqual(gov.classify(Response(503)), 'throttled')
+        self.assertEqual(gov.classify(Response(500)), 'error')
+        self.assertEqual(gov.classify(Response(404)), 'ok')
+        self.assertEqual(gov.classify(ValueError()), 'error')
+
+    def test_request(self):
+        gov = self.governor()
+        with gov.request():
+            self.assertEqual(gov.active, 1)
+        self.assertEqual(gov.active, 0)
+        with self.assertRaises(Response):
+            with gov.request():
+                raise Response(500)
+        self.assertEqual((gov.active, gov.failures), (0, 1))
+
+    def test_stopped_while_open(self):
+        gov = self.governor(stopped=lambda: True)
+        gov.open_circuit(1e12, 'test')
+        with self.assertRaises(CircuitOpenError):
+            gov.acquire()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from openprocurement.complaints.queue.cache import FinalTenders
+from openprocurement.complaints.queue.leases import LeaseTable, CLAIMED, BUSY, DONE
+
+
+def dead_pid():
+    pid = os.fork()
+    if not pid:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+
+class LeaseTableTest(unittest.TestCase):
+
+    tender_id = 'a' * 32
+
+    def setUp(self):
+        self.leases = LeaseTable(size=64, ttl=60, done_ttl=60)
+
+    def slot(self, tender_id):
+        key = FinalTenders.key(tender_id)
+        for slot in self.leases.slots(key):
+            if slot.key == key:
+                return slot
+
+    def test_claim_done(self):
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), CLAIMED)
+        self.leases.done(self.tender_id, '2016-09-01')
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), DONE)
+        # changed since done
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-02'), CLAIMED)
+
+    def test_busy_in_other_worker(self):
+        self.leases.claim(self.tender_id, '2016-09-01')
+        self.slot(self.tender_id).owner = os.getppid()
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), BUSY)
+
+    def test_dead_owner(self):
+        self.leases.claim(self.tender_id, '2016-09-01')
+        self.slot(self.tender_id).owner = dead_pid()
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), CLAIMED)
+        self.assertEqual(self.slot(self.tender_id).owner, os.getpid())
+
+    def test_expired_lease(self):
+        self.leases.claim(self.tender_id, '2016-09-01')
+        slot = self.slot(self.tender_id)
+        slot.owner, slot.expires = os.getppid(), 1
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), CLAIMED)
+
+    def test_release(self):
+        self.leases.claim(self.tender_id, '2016-09-01')
+        self.leases.release(self.tender_id)
+        slot = self.slot(self.tender_id)
+        self.assertEqual((slot.owner, slot.expires), (0, 0))
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), CLAIMED)
+
+    def test_release_keeps_done(self):
+        self.leases.claim(self.tender_id, '2016-09-01')
+        self.leases.done(self.tender_id, '2016-09-01')
+        self.leases.release(self.tender_id)
+        self.assertEqual(self.leases.claim(self.tender_id, '2016-09-01'), DONE)
+
+    def test_collisions_probe_next_slot(self):
+        # same key modulo table size land in neighbour slots
+        ids = ["%016x" % (n * 64 + 5) + 'f' * 16 for n in range(4)]
+        for tender_id in ids:
+            self.assertEqual(self.leases.claim(tender_id, '2016-09-01'), CLAIMED)
+            self.leases.done(tender_id, '2016-09-01')
+        for tender_id in ids:
+            self.assertEqual(self.leases.claim(tender_id, '2016-09-01'), DONE)
+
+    def test_full_table(self):
+        ids = ["%016x" % (n * 64 + 5) + 'f' * 16 for n in range(LeaseTable.max_probes + 1)]
+        for tender_id in ids:
+            self.assertEqual(self.leases.claim(tender_id, '2016-09-01'), CLAIMED)
+        # last one didn't find free slot, claimed w/o lease
+        self.assertEqual(self.slot(ids[-1]), None)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import unittest
+from datetime import datetime, timedelta
+from openprocurement.complaints.queue.client import ComplaintsClient, numeric_offset
+
+
+class FakeFeed(object):
+    """changes feed with one tender per hour, offset is position in feed"""
+
+    def __init__(self, count, offset_format=None):
+        start = datetime(2016, 9, 1)
+        self.dates = [(start + timedelta(hours=i)).isoformat() for i in range(count)]
+        self.offset_format = offset_format or (lambda i: i)
+        self.params = dict()
+        self.requests = 0
+
+    def position(self, offset):
+        return int(str(offset).split('-')[0])
+
+    def get_tenders(self, params={}, feed='changes'):
+        self.requests += 1
+        offset = params.get('offset')
+        if params.get('descending'):
+            i = len(self.dates) if offset is None else self.position(offset)
+            items = self.dates[max(i - 1, 0):i]
+            self.params['offset'] = self.offset_format(i - len(items))
+        else:
+            i = 0 if offset is None else self.position(offset)
+            items = self.dates[i:i + 1]
+            self.params['offset'] = self.offset_format(i + len(items))
+        return [{'dateModified': date} for date in items]
+
+
+class RewindTest(unittest.TestCase):
+
+    def client(self, feed):
+        app = ComplaintsClient.__new__(ComplaintsClient)
+        app.client = feed
+        app.client_config = dict(ComplaintsClient.client_config, limit=100)
+        app.rewind_requests = 0
+        return app
+
+    def test_numeric_offset(self):
+        self.assertEqual(numeric_offset('100'), 100)
+        self.assertEqual(numeric_offset(100), 100)
+        self.assertEqual(numeric_offset('100-g1AAAA'), None)
+        self.assertEqual(numeric_offset(None), None)
+
+    def test_gallop(self):
+        feed = FakeFeed(5000)
+        app = self.client(feed)
+        target = feed.dates.index('2016-10-15T00:00:00')
+        offset = app.gallop_rewind('2016-10-15')
+        # offset before skip_until but less than one page behind
+        self.assertTrue(target - 100 <= offset < target)
+        self.assertTrue(feed.dates[offset] < '2016-10-15')
+        self.assertTrue(app.rewind_requests < 20)
+
+    def test_restores_params(self):
+        feed = FakeFeed(500)
+        feed.params.update({'offset': 7, 'mode': '_all_'})
+        self.client(feed).gallop_rewind('2016-09-10')
+        self.assertEqual(feed.params, {'offset': 7, 'mode': '_all_'})
+
+    def test_before_feed_start(self):
+        app = self.client(FakeFeed(500))
+        self.assertEqual(app.gallop_rewind('2016-08-01'), 0)
+
+    def test_after_feed_end(self):
+        app = self.client(FakeFeed(500))
+        self.assertEqual(app.gallop_rewind('2017-01-01'), 499)
+
+    def test_empty_feed(self):
+        app = self.client(FakeFeed(0))
+        self.assertEqual(app.gallop_rewind('2016-09-10'), None)
+
+    def test_opaque_offsets(self):
+        feed = FakeFeed(500, lambda i: "%d-g1AAAA" % i)
+        app = self.client(feed)
+        self.assertEqual(app.gallop_rewind('2016-09-10'), None)
+        self.assertEqual(feed.requests, 1)
+
+    def test_not_increasing_offsets(self):
+        # numeric top offset, but probes don't move feed forward
+        feed = FakeFeed(500)
+        app = self.client(feed)
+        get_tenders = feed.get_tenders
+
+        def stuck(params={}, **kwargs):
+            result = get_tenders(params)
+            if not params.get('descending'):
+                feed.params['offset'] = params.get('offset')
+            return result
+        feed.get_tenders = stuck
+        self.assertEqual(app.gallop_rewind('2016-09-10'), None)
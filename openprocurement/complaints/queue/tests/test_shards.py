@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from Queue import Queue
+from openprocurement.complaints.queue.cache import TenderCache
+from openprocurement.complaints.queue.feed import FeedItem
+from openprocurement.complaints.queue.shards import shard_index, ShardDispatcher
+
+
+class FakeApp(object):
+    should_stop = False
+
+    def __init__(self):
+        self.tender_cache = TenderCache(100)
+
+    def reset_watchdog(self):
+        pass
+
+    def cache_expires(self, status=None):
+        return None
+
+
+def make_tenders(count):
+    return [FeedItem("%032x" % (n * 104729), '2016-09-01T00:%02d' % n) for n in range(count)]
+
+
+class ShardIndexTest(unittest.TestCase):
+
+    def test_stable(self):
+        # crc32 of tender_id, same in python processes w/o hash seed
+        self.assertEqual(shard_index('a' * 32, 4), shard_index('a' * 32, 4))
+        self.assertEqual(shard_index('0' * 32, 7), 1)
+
+    def test_spread(self):
+        counts = [0] * 4
+        for tender in make_tenders(400):
+            index = shard_index(tender.id, 4)
+            self.assertTrue(0 <= index < 4)
+            counts[index] += 1
+        self.assertTrue(min(counts) > 50)
+
+
+class ShardDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = FakeApp()
+        self.queues = [Queue(), Queue()]
+        self.acks = Queue()
+        self.dispatcher = ShardDispatcher(self.app, self.queues, self.acks, timeout=10)
+        self.page_id = "%d-1" % os.getpid()
+
+    def ack(self, index, tenders, page_id=None):
+        self.acks.put((page_id or self.page_id, index, [t.id for t in tenders]))
+
+    def routed(self, tenders, index):
+        return [t for t in tenders if shard_index(t.id, 2) == index]
+
+    def test_routes_by_shard(self):
+        tenders = make_tenders(20)
+        self.ack(0, self.routed(tenders, 0))
+        self.ack(1, self.routed(tenders, 1))
+        self.assertEqual(self.dispatcher(tenders), set())
+        for index, queue in enumerate(self.queues):
+            items = [queue.get_nowait() for i in range(queue.qsize())]
+            # page ends with marker
+            self.assertEqual(items[-1], (self.page_id, None, None))
+            self.assertEqual([item[1] for item in items[:-1]],
+                [t.id for t in self.routed(tenders, index)])
+        for tender in tenders:
+            self.assertEqual(self.app.tender_cache.get(tender.id), tender.dateModified)
+
+    def test_not_acked_failed(self):
+        tenders = make_tenders(20)
+        shard1 = self.routed(tenders, 1)
+        self.ack(0, self.routed(tenders, 0))
+        # restarted shard processed only part of page
+        self.ack(1, shard1[:2])
+        failed = self.dispatcher(tenders)
+        self.assertEqual(failed, set([t.id for t in shard1[2:]]))
+        self.assertEqual(self.app.tender_cache.get(shard1[2].id), None)
+
+    def test_ignore_other_page(self):
+        tenders = make_tenders(10)
+        self.ack(0, tenders, page_id='0-0')
+        self.ack(0, self.routed(tenders, 0))
+        self.ack(1, self.routed(tenders, 1))
+        self.assertEqual(self.dispatcher(tenders), set())
+
+    def test_timeout(self):
+        self.dispatcher.timeout = -1
+        with self.assertRaises(SystemExit):
+            self.dispatcher(make_tenders(2))
+
+    def test_stop(self):
+        self.app.should_stop = True
+        with self.assertRaises(SystemExit):
+            self.dispatcher(make_tenders(2))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from simplejson import loads
+from openprocurement_client.exceptions import InvalidResponse
+from openprocurement.complaints.queue.feed import parse_feed_page
+from openprocurement.complaints.queue.utils import retry
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PooledTendersClient(object):
+    """Tenders API client over requests.Session with keep-alive connections pool,
+    safe for concurrent get_tender calls from fetch workers"""
+
+    ignore_params = ('uri', 'path')
+
+    def __init__(self, key='', host_url="https://api-sandbox.openprocurement.org",
+                 api_version='2.3', params=None, user_agent=None, timeout=300,
+                 pool_size=10, resource='tenders', governor=None):
+        if requests is None:
+            raise ImportError("Transport 'requests' needs requests package installed")
+        self.host_url = host_url.rstrip('/')
+        self.prefix_path = '/api/{}/{}'.format(api_version, resource)
+        self.params = dict(params or {})
+        self.timeout = float(timeout or 300)
+        self.governor = governor
+        self.headers = {'Content-Type': 'application/json'}
+        if user_agent:
+            self.headers['User-Agent'] = user_agent
+        self.session = requests.Session()
+        if key:
+            self.session.auth = (key, '')
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(int(pool_size), 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _update_params(self, params):
+        for key in params:
+            if key not in self.ignore_params:
+                self.params[key] = params[key]
+
+    def request(self, path, params=None, feed=False):
+        if self.governor:
+            with self.governor.request():
+                return self.send(path, params, feed)
+        return self.send(path, params, feed)
+
+    def send(self, path, params=None, feed=False):
+        response = self.session.get(self.host_url + path, params=params,
+            headers=self.headers, timeout=self.timeout)
+        if response.status_code != 200:
+            error = InvalidResponse("{} {}".format(response.status_code, response.reason))
+            error.status_int = response.status_code
+            raise error
+        if feed:
+            return parse_feed_page(response.content)
+        return loads(response.content)
+
+    # governor paces requests after failures, don't wait long here
+    @retry(tries=3, delay=2, logger=logger)
+    def get_tenders(self, params={}, feed='changes'):
+        params['feed'] = feed
+        self._update_params(params)
+        try:
+            data, next_page = self.request(self.prefix_path, self.params, feed=True)
+        except InvalidResponse as e:
+            if getattr(e, 'status_int', None) == 404:
+                # don't reuse offset which server doesn't know
+                self.params.pop('offset', None)
+            raise
+        self._update_params(next_page)
+        return data
+
+    def get_tender(self, tender_id):
+        """return decoded tender json w/o munchify"""
+        return self.request('{}/{}'.format(self.prefix_path, tender_id))
+
+    def close(self):
+        self.session.close()
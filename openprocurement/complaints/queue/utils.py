@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import time
+import zlib
+import simplejson as json
 from functools import wraps
+from openprocurement.complaints.queue.metrics import metrics
 
 bool_dict = {'y': 1, 'n': 0, 'yes': 1, 'no': 0,
     'on': 1, 'off': 0, 'true': 1, 'false': 0}
@@ -24,6 +27,7 @@ def retry(ExceptionToCheck=Exception, tries=5, delay=5, backoff=2, logger=None):
                 except ExceptionToCheck, e:
                     if logger:
                         logger.error("%s, Retrying in %d seconds..." % (str(e), mdelay))
+                    metrics.inc('retries_total', func=f.__name__)
                     for i in range(int(10 * mdelay)):
                         time.sleep(0.1)
                     mtries -= 1
@@ -31,3 +35,18 @@ def retry(ExceptionToCheck=Exception, tries=5, delay=5, backoff=2, logger=None):
             return f(*args, **kwargs)
         return f_retry  # true decorator
     return deco_retry
+
+def compress_json(value, min_size=0, level=6):
+    """return (data, format) where data is zlib compressed json if longer than min_size"""
+    if len(value) < int(min_size or 0):
+        return value, 'json'
+    return zlib.compress(value, level), 'zlib'
+
+def decode_json(data, data_format=None):
+    """decode complaint_json or cancellation_json stored as plain or zlib compressed json,
+    if data_format is not known it is detected by zlib header"""
+    if data is None:
+        return None
+    if data_format == 'zlib' or (data_format is None and data[:1] == 'x'):
+        data = zlib.decompress(data)
+    return json.loads(data)
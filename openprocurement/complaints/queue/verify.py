@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+from time import time
+from calendar import timegm
+from iso8601 import parse_date
+from openprocurement.complaints.queue.cache import FinalTenders
+from openprocurement.complaints.queue.metrics import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+OK, MISSING, STALE = 'ok', 'missing', 'stale'
+
+
+def timestamp(date_modified):
+    date = parse_date(date_modified)
+    return timegm(date.utctimetuple()) + date.microsecond / 1e6
+
+
+class ProcessedTenders(FinalTenders):
+    """Compact index of tenders stored in database, keeps newest
+    dateModified of tender as unix time, about 16 bytes per tender"""
+
+    value_type = 'd'
+
+    @staticmethod
+    def value(date_modified):
+        return timestamp(date_modified)
+
+    def add(self, tender_id, date_modified):
+        key, value = self.key(tender_id), self.value(date_modified)
+        with self.lock:
+            current = self.lookup(key)
+            if current and current >= value:
+                return
+            self.pending[key] = value
+            if len(self.pending) >= max(self.merge_size, len(self.keys) // 8):
+                self.merge()
+
+    def compare(self, tenders_list):
+        """return list of (tender, state) for feed page"""
+        result = list()
+        with self.lock:
+            for tender in tenders_list:
+                stored = self.lookup(self.key(tender.id))
+                if not stored:
+                    result.append((tender, MISSING))
+                elif stored < self.value(tender.dateModified):
+                    result.append((tender, STALE))
+                else:
+                    result.append((tender, OK))
+        return result
+
+
+def load_index(app):
+    index = ProcessedTenders()
+    for n, (tender_id, date_modified) in enumerate(app.iter_processed()):
+        index.add(tender_id, date_modified)
+        if n % 10000 == 0:
+            app.reset_watchdog()
+    index.merge()
+    logger.info("Loaded %d tenders from database", len(index))
+    return index
+
+
+def verify_feed(app, date_from=None, refetch=True):
+    """compare dateModified feed from date_from with tenders stored in
+    database, download missing and stale ones, return report lines"""
+    start_time = time()
+    index = load_index(app)
+    stats = dict.fromkeys(['feed', OK, MISSING, STALE, 'recent', 'refetched',
+        'failed'], 0)
+    # not app.skip_until, backend raised it to last stored complaint
+    date_from = date_from or app.client_config['skip_until']
+    if date_from:
+        app.client.params['offset'] = date_from
+    else:
+        app.client.params.pop('offset', None)
+    logger.info("Start verify from %s", date_from or 'feed start')
+
+    while not app.should_stop:
+        app.reset_watchdog()
+        try:
+            tenders_list = app.client.get_tenders(feed='dateModified')
+        except (SystemExit, KeyboardInterrupt):
+            raise
+        except Exception as e:
+            logger.error("Fail get_tenders {}: {}".format(type(e), e))
+            app.sleep(10)
+            app.handle_error(e)
+            continue
+
+        if not tenders_list:
+            break
+
+        refetch_list = list()
+        for tender, state in index.compare(tenders_list):
+            # changed after database was loaded, left to running workers
+            if timestamp(tender.dateModified) >= start_time:
+                stats['recent'] += 1
+                continue
+            stats['feed'] += 1
+            stats[state] += 1
+            metrics.inc('verify_tenders_total', state=state)
+            if state != OK:
+                logger.debug("Verify T=%s DM=%s %s", tender.id, tender.dateModified, state)
+                refetch_list.append(tender)
+
+        if refetch and refetch_list:
+            try:
+                failed = app.process_tenders(refetch_list, sleep_time=0)
+                app.flush(force=True)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception as e:
+                logger.error("Fail refetch {}: {}".format(type(e), e))
+                app.sleep(10)
+                app.handle_error(e)
+                failed = refetch_list
+            stats['refetched'] += len(refetch_list) - len(failed)
+            stats['failed'] += len(failed)
+
+        logger.info("Verified %d tenders %d missing %d stale, last %s", stats['feed'],
+            stats[MISSING], stats[STALE], tenders_list[-1].dateModified)
+
+        if timestamp(tenders_list[-1].dateModified) >= start_time:
+            break
+
+    if app.should_stop:
+        logger.warning("Verify interrupted, report is incomplete")
+    # database tenders not seen in feed, modified before date_from or deleted
+    matched = stats[OK] + stats[STALE]
+    report = [
+        "Database tenders %d, feed tenders %d from %s" % (len(index), stats['feed'],
+            date_from or 'feed start'),
+        "Up to date %d, missing %d, stale %d, not in feed %d" % (stats[OK],
+            stats[MISSING], stats[STALE], max(len(index) - matched, 0)),
+        "Refetched %d, failed %d, changed during verify %d" % (stats['refetched'],
+            stats['failed'], stats['recent']),
+        "Verify finished in %1.1f sec" % (time() - start_time),
+    ]
+    return report
@@ -23,6 +23,7 @@ setup(name='openprocurement.complaints.queue',
         namespace_packages=['openprocurement'],
         include_package_data=True,
         zip_safe=False,
+        test_suite='openprocurement.complaints.queue.tests',
         install_requires=[
           'iso8601',
           'python-dateutil',
@@ -30,9 +31,13 @@ setup(name='openprocurement.complaints.queue',
           'MySQL-python',
           'openprocurement_client==1.0b3',
         ],
+        extras_require={
+          'requests': ['requests'],
+        },
         entry_points={
           'console_scripts': [
               'complaintsd = openprocurement.complaints.queue.queue_worker:main',
+              'complaints-bench = openprocurement.complaints.queue.benchmark:main',
           ],
         }
     )